@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+from filters import ALL
+
+# One cube cell per combination of these values
+CUBE_DIMENSIONS = ['neighbourhood group', 'neighbourhood', 'room type', 'cancellation_policy', 'instant_bookable']
+
+# Numeric columns summarized in every cell
+CUBE_MEASURES = ['price', 'service fee', 'availability 365', 'number of reviews', 'minimum nights',
+                 'calculated host listings count']
+
+STATS = ['rows', 'count', 'sum', 'mean', 'std', 'min', 'max']
+
+
+# Boolean mask over cube cells whose keys match every dimension filter in `where`
+def select_cells(keys, where):
+    mask = np.ones(len(keys), dtype=bool)
+    for col, value in (where or {}).items():
+        if isinstance(value, str) and value == ALL:
+            continue
+        mask &= (keys[col] == value).to_numpy(dtype=bool, na_value=False)
+    return mask
+
+
+# Positions of every entry of the selected `cells` (a boolean mask) in a per-cell table stored CSR-style,
+# cell c's entries at offsets[c]:offsets[c + 1]; one gather instead of a Python loop over cells
+def cell_entries(offsets, cells):
+    selected = np.flatnonzero(cells)
+    lengths = offsets[selected + 1] - offsets[selected]
+    return np.arange(lengths.sum()) + np.repeat(offsets[selected] - np.cumsum(lengths) + lengths, lengths)
+
+
+# Dimension values of each row as hashable tuples, with every kind of missing value mapped to None
+def key_tuples(df, dimensions):
+    columns = [df[col].astype(object).where(df[col].notna(), None) for col in dimensions]
+    return list(zip(*columns))
+
+
+# count/sum/sum-of-squares/min/max of every measure per dimension cell, computed once per dataset version.
+# Page summaries (KPIs, top-N groupbys, value counts) are rolled up from the cells instead of the raw rows,
+# optionally restricted to cells matching a set of dimension filters. `row_cells` records each row's cell
+# so other per-cell stores (histograms) and incremental updates can reuse the assignment.
+class AggregateCube:
+    def __init__(self, df, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES):
+        self.dimensions = [col for col in dimensions if col in df.columns]
+        self.measures = [col for col in measures if col in df.columns]
+        self.version = df.attrs.get('version')
+
+        grouped = df.groupby([df[col] for col in self.dimensions], observed=True, dropna=False, sort=False)
+        self.row_cells = grouped.ngroup().to_numpy().astype(np.int32)
+        self.keys = grouped.size().index.to_frame(index=False)
+        self.cells = self._summarize(df, self.row_cells, len(self.keys))
+
+    def _summarize(self, df, row_cells, n_cells):
+        cells = {'rows': np.bincount(row_cells, minlength=n_cells)}
+        for col in self.measures:
+            values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = ~np.isnan(values)
+            ids, values = row_cells[valid], values[valid]
+            sums = np.bincount(ids, weights=values, minlength=n_cells)
+            mins = np.full(n_cells, np.nan)
+            maxs = np.full(n_cells, np.nan)
+            np.fmin.at(mins, ids, values)
+            np.fmax.at(maxs, ids, values)
+            cells[(col, 'count')] = np.bincount(ids, minlength=n_cells)
+            # Integer columns keep integer totals (e.g. "Total Reviews")
+            cells[(col, 'sum')] = sums.round().astype(np.int64) if pd.api.types.is_integer_dtype(df[col]) else sums
+            cells[(col, 'sumsq')] = np.bincount(ids, weights=values ** 2, minlength=n_cells)
+            cells[(col, 'min')] = mins
+            cells[(col, 'max')] = maxs
+        return cells
+
+    # New cube for `new_df` = old rows where `keep` is True followed by the upserted rows (see
+    # data_loader.upsert). Counts and sums are adjusted by the removed and added rows only; min/max are
+    # recomputed just for cells that lost rows.
+    def apply_delta(self, old_df, new_df, keep):
+        n_kept = int(np.count_nonzero(keep))
+        added = new_df.iloc[n_kept:]
+
+        lookup = {key: cell for cell, key in enumerate(key_tuples(self.keys, self.dimensions))}
+        new_keys = []
+        added_cells = np.empty(len(added), dtype=np.int32)
+        for i, key in enumerate(key_tuples(added, self.dimensions)):
+            if key not in lookup:
+                lookup[key] = len(lookup)
+                new_keys.append(key)
+            added_cells[i] = lookup[key]
+
+        cube = AggregateCube.__new__(AggregateCube)
+        cube.dimensions, cube.measures = self.dimensions, self.measures
+        cube.version = new_df.attrs.get('version')
+        # Categories may have grown with the delta, so old and new keys take the new frame's dtypes
+        key_dtypes = new_df[self.dimensions].dtypes.to_dict()
+        cube.keys = pd.concat([self.keys.astype(key_dtypes),
+                               pd.DataFrame(new_keys, columns=self.dimensions).astype(key_dtypes)],
+                              ignore_index=True)
+        cube.row_cells = np.concatenate([self.row_cells[keep], added_cells]).astype(np.int32)
+
+        n_cells = len(cube.keys)
+        removed = self._summarize(old_df[~keep], self.row_cells[~keep], n_cells)
+        additions = self._summarize(added, added_cells, n_cells)
+        cube.cells = {}
+        for name, values in self.cells.items():
+            part = name if name == 'rows' else name[1]
+            fill = np.nan if part in ('min', 'max') else 0
+            padded = np.concatenate([values, np.full(n_cells - len(values), fill, dtype=values.dtype)])
+            if part == 'min':
+                cube.cells[name] = np.fmin(padded, additions[name])
+            elif part == 'max':
+                cube.cells[name] = np.fmax(padded, additions[name])
+            else:
+                cube.cells[name] = padded + additions[name] - removed[name]
+
+        touched = np.flatnonzero(removed['rows'] > 0)
+        if len(touched):
+            in_touched = np.isin(cube.row_cells, touched)
+            recomputed = self._summarize(new_df[in_touched], cube.row_cells[in_touched], n_cells)
+            for col in self.measures:
+                for part in ('min', 'max'):
+                    cube.cells[(col, part)][touched] = recomputed[(col, part)][touched]
+        return cube
+
+    # Cell columns needed for `stat`, restricted to the selected cells
+    def _parts(self, measure, stat, mask):
+        if stat == 'rows':
+            return {'rows': self.cells['rows'][mask]}
+        needed = {'count': ['count'], 'sum': ['sum'], 'mean': ['sum', 'count'], 'std': ['sum', 'sumsq', 'count'],
+                  'min': ['min'], 'max': ['max']}[stat]
+        return {part: self.cells[(measure, part)][mask] for part in needed}
+
+    @staticmethod
+    def _finish(parts, stat):
+        if stat in ('rows', 'count', 'sum', 'min', 'max'):
+            return parts[stat]
+        count = parts['count'].where(parts['count'] > 0).astype('float64')
+        mean = parts['sum'] / count
+        if stat == 'mean':
+            return mean
+        variance = (parts['sumsq'] - parts['sum'] * mean) / (count - 1)
+        return np.sqrt(variance)
+
+    # Aggregate `measure` grouped by one dimension (a Series, like df.groupby(by)[measure].<stat>())
+    # or over everything when `by` is None. `where` maps dimensions to the values to keep.
+    def rollup(self, by=None, measure=None, stat='rows', where=None, dropna=True):
+        if stat not in STATS:
+            raise ValueError(f"Unknown statistic {stat!r}; expected one of {STATS}")
+        # Cells emptied by incremental updates are kept but never reported
+        mask = select_cells(self.keys, where) & (self.cells['rows'] > 0)
+        parts = pd.DataFrame(self._parts(measure, stat, mask))
+        reducers = {'rows': 'sum', 'count': 'sum', 'sum': 'sum', 'sumsq': 'sum', 'min': 'min', 'max': 'max'}
+
+        if by is None:
+            totals = {part: getattr(parts[part], reducers[part])() for part in parts.columns}
+            if stat in ('mean', 'std'):
+                totals = {part: pd.Series([value]) for part, value in totals.items()}
+                return self._finish(totals, stat).iloc[0]
+            return totals[stat]
+
+        keys = self.keys.loc[mask, by].reset_index(drop=True)
+        rolled = parts.groupby(keys, observed=True, dropna=dropna).agg({part: reducers[part] for part in parts})
+        result = self._finish(rolled, stat)
+        result.name = measure if stat != 'rows' else 'count'
+        return result
+
+    # Equivalent of df[by].value_counts() for the selected cells
+    def value_counts(self, by, where=None, dropna=True):
+        counts = self.rollup(by, stat='rows', where=where, dropna=dropna)
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
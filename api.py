@@ -0,0 +1,226 @@
+import argparse
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import queries
+from approximate import Estimate
+from dataset import LiveDataset
+from filters import ALL, intersect_sorted
+from recommender import DEFAULT_TOP_K
+from spatial import TILE_ZOOMS
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+logger = logging.getLogger(__name__)
+
+
+def _text(params, name, default=ALL):
+    return params.get(name, [default])[0]
+
+
+# Numeric parameter, ValueError when outside the inclusive [low, high] (NaN never is inside)
+def _number(params, name, cast, default=None, low=None, high=None):
+    value = params.get(name, [None])[0]
+    if value in (None, ''):
+        return default
+    value = cast(value)
+    if (low is not None and not value >= low) or (high is not None and not value <= high):
+        if low is not None and high is not None:
+            raise ValueError(f"{name} must be between {low} and {high}")
+        raise ValueError(f"{name} must be at least {low}" if low is not None else f"{name} must be at most {high}")
+    return value
+
+
+def _flag(params, name):
+    return _text(params, name, 'false').lower() in ('1', 'true', 'yes')
+
+
+def _kpis(dataset, params):
+    return queries.dashboard_kpis(dataset)
+
+
+def _value_counts(dataset, params):
+    return queries.value_counts(dataset, params['column'][0], dropna=not _flag(params, 'keep_missing'))
+
+
+def _comparative(dataset, params):
+    names = params.get('name', list(queries.COMPARATIVE_QUERIES))
+    return {name: queries.comparative(dataset, name) for name in names}
+
+
+# 'south,west,north,east' -> tuple of floats
+def _bbox(params):
+    value = params.get('bbox', [None])[0]
+    if not value:
+        return None
+    bbox = tuple(float(part) for part in value.split(','))
+    if len(bbox) != 4:
+        raise ValueError("bbox must be south,west,north,east")
+    south, west, north, east = bbox
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        raise ValueError("bbox must have -90 <= south <= north <= 90 and -180 <= west <= east <= 180")
+    return bbox
+
+
+def _listings(dataset, params):
+    bbox = _bbox(params)
+    rows = queries.listings_overview_rows(dataset, _text(params, 'country'), _text(params, 'neighbourhood_group'),
+                                          _text(params, 'neighbourhood'), _text(params, 'room_type'),
+                                          boxes=[bbox] if bbox else ())
+    if 'radius_km' in params:
+        nearby = queries.nearby_rows(dataset, _number(params, 'lat', float, low=-90, high=90),
+                                     _number(params, 'lon', float, low=-180, high=180),
+                                     _number(params, 'radius_km', float, low=0))
+        rows = intersect_sorted(rows, nearby)
+    return queries.availability_bands(dataset, rows)
+
+
+def _trends(dataset, params):
+    where = {column: params[key][0] for key, column in [('neighbourhood_group', 'neighbourhood group'),
+                                                        ('room_type', 'room type')] if key in params}
+    trends = queries.review_trends(dataset, _text(params, 'freq', 'M'), _text(params, 'measure', 'listings'),
+                                   params.get('by', [None])[0], where, _text(params, 'start', None),
+                                   _text(params, 'end', None), _number(params, 'window', int, low=1))
+    return trends.reset_index()
+
+
+# Aggregated tiles only; individual listing locations are never returned
+def _density(dataset, params):
+    where = {column: _text(params, key) for key, column in [('country', 'country'),
+                                                            ('neighbourhood_group', 'neighbourhood group'),
+                                                            ('neighbourhood', 'neighbourhood'),
+                                                            ('room_type', 'room type')]}
+    return queries.density_tiles(dataset, _number(params, 'zoom', int, TILE_ZOOMS[1]), _bbox(params), where=where)
+
+
+# ?approximate=1 answers from the stratified sample, each total as {value, margin}
+def _insights(dataset, params):
+    filters = (_text(params, 'country'), _text(params, 'neighbourhood_group'), _text(params, 'neighbourhood'),
+               _text(params, 'room_type'), _flag(params, 'instant_bookable'), _text(params, 'cancellation_policy'),
+               _number(params, 'min_nights', int), _number(params, 'max_price', float))
+    if _flag(params, 'approximate'):
+        return queries.approximate_insights_totals(dataset, queries.sampled_insights_rows(dataset, *filters), *filters)
+    return queries.detailed_insights_totals(dataset, queries.detailed_insights_rows(dataset, *filters))
+
+
+def _recommendations(dataset, params):
+    nights, k = _number(params, 'nights', int, low=1), _number(params, 'k', int, DEFAULT_TOP_K, low=1)
+    budget = _number(params, 'budget', float, low=0)
+    if nights is None or budget is None:
+        raise ValueError("nights and budget are required")
+    return queries.recommendations(dataset, params['neighbourhood_group'][0], params['neighbourhood'][0],
+                                   budget, nights, _text(params, 'room_type', 'Any'), k)
+
+
+# GET path -> handler(dataset, query params); each returns a dict, Series or DataFrame
+ROUTES = {
+    '/kpis': _kpis,
+    '/value_counts': _value_counts,
+    '/comparative': _comparative,
+    '/listings': _listings,
+    '/density': _density,
+    '/trends': _trends,
+    '/insights': _insights,
+    '/recommendations': _recommendations,
+}
+
+
+def _jsonable(value):
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient='records', date_format='iso'))
+    if isinstance(value, pd.Series):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, Estimate):
+        return value._asdict()
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value
+
+
+def _to_table(value):
+    if isinstance(value, pd.DataFrame):
+        return pa.Table.from_pandas(value, preserve_index=False)
+    if isinstance(value, pd.Series):
+        frame = value.rename('value').rename_axis('key').reset_index()
+        frame['key'] = frame['key'].astype(str)
+        return pa.Table.from_pandas(frame, preserve_index=False)
+    if isinstance(value, dict) and all(isinstance(item, pd.Series) for item in value.values()):
+        # One long table (key, value, name) over every named series; values share a float column
+        return pa.concat_tables([_to_table(item.astype('float64')).append_column('name', pa.array([name] * len(item)))
+                                 for name, item in value.items()])
+    return pa.Table.from_pylist([_jsonable(value)])
+
+
+def encode(value, arrow=False):
+    if arrow:
+        sink = pa.BufferOutputStream()
+        table = _to_table(value)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_STREAM
+    return json.dumps(_jsonable(value)).encode(), 'application/json'
+
+
+# HTTP/1.1 with Content-Length on every response, so clients can keep connections alive; the
+# threading server handles each connection on its own thread over the shared read-only dataset
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    live_dataset = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        route = ROUTES.get(url.path)
+        if route is None:
+            self._send(404, *encode({'error': f"unknown endpoint {url.path}"}))
+            return
+        params = parse_qs(url.query)
+        arrow = _text(params, 'format', 'json') == 'arrow' or ARROW_STREAM in self.headers.get('Accept', '')
+        try:
+            body, content_type = encode(route(self.live_dataset.refresh(), params), arrow)
+        except (KeyError, ValueError, TypeError) as exc:
+            self._send(400, *encode({'error': f"bad query: {exc}"}))
+            return
+        except Exception as exc:
+            # Always answer, so a keep-alive client is not left without a status line
+            logger.exception("GET %s failed", self.path)
+            self._send(500, *encode({'error': f"internal error: {type(exc).__name__}"}))
+            return
+        self._send(200, body, content_type)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(host='127.0.0.1', port=8502, live_dataset=None):
+    QueryHandler.live_dataset = live_dataset if live_dataset is not None else LiveDataset()
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard queries over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+    server = serve(args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
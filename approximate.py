@@ -0,0 +1,183 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from aggregates import cell_entries, select_cells
+from filters import RANGE_COLUMNS, FilterIndex
+from histograms import FINE_BINS, Histogram
+
+# The sample is stratified on these, so every neighbourhood group / room type is represented
+SAMPLE_STRATA = ['neighbourhood group', 'room type']
+
+# Rows kept across all strata (allocated proportionally), and the least kept per stratum; strata
+# smaller than that are kept whole
+SAMPLE_ROWS = 20000
+MIN_STRATUM_ROWS = 100
+
+# Distinct ids are sketched per cell of the Detailed Insights equality filters, so any combination of
+# them is answered by merging the matching cells' sketches
+DISTINCT_CELLS = ['country', 'neighbourhood group', 'neighbourhood', 'room type', 'instant_bookable',
+                  'cancellation_policy']
+
+# HyperLogLog with 2**12 registers: ~1.6% relative standard error for a merged selection
+HLL_PRECISION = 12
+HLL_ERROR = 1.04 / np.sqrt(2 ** HLL_PRECISION)
+
+# Margins are half-widths of 95% normal confidence intervals
+Z_95 = 1.96
+
+
+# An estimated value with the half-width of its 95% confidence interval
+class Estimate(NamedTuple):
+    value: float
+    margin: float
+
+
+# Per-group HyperLogLog sketches of the values in each group, stored sparsely: only the nonzero
+# registers, as (offsets, buckets, ranks) with group g's at offsets[g]:offsets[g + 1]. A group never
+# holds more entries than it has rows (nor more than 2**precision), so small groups stay small.
+def hll_sketches(values, groups, n_groups, precision=HLL_PRECISION):
+    hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+    buckets = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    # Position of the leftmost 1 bit in the remaining bits; frexp's exponent is the bit length and
+    # exact because rest < 2**52
+    _, bit_length = np.frexp(rest.astype(np.float64))
+    rank = (64 - precision + 1 - bit_length).astype(np.uint8)
+    keys = (groups.astype(np.int64) << precision) + buckets
+    # Highest rank per (group, bucket): the last entry of each key once sorted by key, then rank
+    order = np.lexsort((rank, keys))
+    keys, rank = keys[order], rank[order]
+    last = np.flatnonzero(np.append(keys[1:] != keys[:-1], True)) if len(keys) else np.empty(0, dtype=np.int64)
+    keys, rank = keys[last], rank[last]
+    offsets = np.searchsorted(keys >> precision, np.arange(n_groups + 1))
+    return offsets, (keys & ((1 << precision) - 1)).astype(np.uint16), rank
+
+
+# Dense registers of the union of the groups selected by the boolean mask `groups`
+def hll_merge(sketches, groups, precision=HLL_PRECISION):
+    offsets, buckets, ranks = sketches
+    entries = cell_entries(offsets, groups)
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    np.maximum.at(registers, buckets[entries], ranks[entries])
+    return registers
+
+
+# Distinct-count estimate per row of registers, with linear counting for small cardinalities
+def hll_estimate(registers):
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+# Variance of a stratified total from per-stratum sums and sums of squares of the sampled values
+def _stratified_variance(sums, sumsq, sampled, population):
+    n = np.maximum(sampled, 2)
+    spread = np.maximum(sumsq - sums ** 2 / np.maximum(sampled, 1), 0) / (n - 1)
+    return np.sum(population ** 2 * (1 - sampled / np.maximum(population, 1)) * spread / n)
+
+
+# Histogram estimated from a stratified sample: `counts` are the weighted estimates, and the sampled
+# counts are kept per stratum so each display bar gets its own confidence interval
+class SampledHistogram(Histogram):
+    def __init__(self, stratum_counts, sampled, population, edges):
+        weights = population / np.maximum(sampled, 1)
+        super().__init__(weights @ stratum_counts, edges)
+        self.stratum_counts = stratum_counts
+        self.sampled = sampled
+        self.population = population
+
+    def margins(self, bins):
+        bounds = self._bounds(bins)
+        if bounds is None:
+            return np.zeros(0)
+        start, bounds = bounds
+        bars = np.add.reduceat(self.stratum_counts[:, start:bounds[-1]], bounds[:-1] - start, axis=1)
+        # A bar is a sum of 0/1 indicators, so its sum of squares equals its sum
+        return Z_95 * np.sqrt([_stratified_variance(bar, bar, self.sampled, self.population) for bar in bars.T])
+
+
+# Stratified random sample of the listings plus per-cell HyperLogLog sketches of `id`, built once per
+# dataset version. Filters run on the sample's own FilterIndex; totals and histograms are scaled up by
+# stratum and come with 95% confidence intervals.
+class StratifiedSample:
+    def __init__(self, df, histograms, size=SAMPLE_ROWS, seed=0):
+        strata_columns = [col for col in SAMPLE_STRATA if col in df.columns]
+        grouped = df.groupby([df[col] for col in strata_columns], observed=True, dropna=False, sort=False)
+        row_strata = grouped.ngroup().to_numpy().astype(np.int64)
+        self.population = np.bincount(row_strata).astype(np.float64)
+        n_strata = len(self.population)
+
+        share = np.ceil(self.population * min(1.0, size / max(len(df), 1)))
+        quota = np.minimum(self.population, np.maximum(share, MIN_STRATUM_ROWS)).astype(np.int64)
+        # A random rank within each stratum; the first `quota` ranks are kept
+        order = np.lexsort((np.random.default_rng(seed).random(len(df)), row_strata))
+        starts = np.concatenate([[0], np.cumsum(self.population.astype(np.int64))[:-1]])
+        rank = np.empty(len(df), dtype=np.int64)
+        rank[order] = np.arange(len(df)) - starts[row_strata[order]]
+        self.rows = np.flatnonzero(rank < quota[row_strata]).astype(np.int32)
+        self.strata = row_strata[self.rows]
+        self.sampled = np.bincount(self.strata, minlength=n_strata).astype(np.float64)
+
+        self.df = df.iloc[self.rows].reset_index(drop=True)
+        self.filter_index = FilterIndex(self.df)
+        self.edges = histograms.edges
+        self.bin_ids = {col: ids[self.rows] for col, ids in histograms.bin_ids.items()}
+
+        # Sketches over the full frame, not the sample; the numeric extents tell a range that excludes
+        # nothing (a slider at its end) from a real range filter
+        dimensions = [col for col in DISTINCT_CELLS if col in df.columns]
+        grouped = df.groupby([df[col] for col in dimensions], observed=True, dropna=False, sort=False)
+        row_cells = grouped.ngroup().to_numpy().astype(np.int64)
+        self.cell_keys = grouped.size().index.to_frame(index=False)
+        self.cell_rows = np.bincount(row_cells, minlength=len(self.cell_keys)).astype(np.float64)
+        self.cell_sketches = hll_sketches(df['id'].to_numpy(), row_cells, len(self.cell_keys))
+        self.extents = {col: (df[col].min(), df[col].max()) for col in RANGE_COLUMNS if col in df.columns}
+
+    def _totals(self, rows, values=None):
+        matched = np.zeros(len(self.rows))
+        matched[rows] = 1.0 if values is None else np.nan_to_num(values[rows])
+        sums = np.bincount(self.strata, weights=matched, minlength=len(self.population))
+        sumsq = np.bincount(self.strata, weights=matched ** 2, minlength=len(self.population))
+        return sums, sumsq
+
+    # Estimated total of `column` (or the number of rows when None) over the matching sample positions
+    def total(self, rows, column=None):
+        values = None if column is None else self.df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        sums, sumsq = self._totals(rows, values)
+        weights = self.population / np.maximum(self.sampled, 1)
+        variance = _stratified_variance(sums, sumsq, self.sampled, self.population)
+        return Estimate(float(weights @ sums), Z_95 * float(np.sqrt(variance)))
+
+    def _excludes_nothing(self, col, low, high):
+        if col not in self.extents:
+            return low is None and high is None
+        smallest, largest = self.extents[col]
+        return (low is None or low <= smallest) and (high is None or high >= largest)
+
+    # Estimated distinct ids among the listings matching the filters that gave `rows` (FilterIndex.select's
+    # equals/ranges). The equality filters are answered exactly by merging the matching cells' sketches.
+    # Range filters cut across cells, so they fall back to the sampled row estimate scaled by the
+    # distinct-per-listing ratio of the merged cells.
+    def distinct_ids(self, rows, equals=(), ranges=()):
+        where = {col: value for col, value in equals if col in self.cell_keys.columns}
+        cells = select_cells(self.cell_keys, where)
+        if not cells.any():
+            return Estimate(0.0, 0.0)
+        distinct = float(hll_estimate(hll_merge(self.cell_sketches, cells)))
+        if all(self._excludes_nothing(col, low, high) for col, low, high in ranges):
+            return Estimate(distinct, Z_95 * distinct * HLL_ERROR)
+        ratio = min(distinct / self.cell_rows[cells].sum(), 1.0)
+        matched = self.total(rows)
+        value = ratio * matched.value
+        return Estimate(value, float(np.hypot(ratio * matched.margin, Z_95 * value * HLL_ERROR)))
+
+    def histogram(self, measure, rows):
+        stratum_counts = np.zeros((len(self.population), FINE_BINS + 1))
+        np.add.at(stratum_counts, (self.strata[rows], self.bin_ids[measure][rows]), 1)
+        return SampledHistogram(stratum_counts[:, :FINE_BINS], self.sampled, self.population, self.edges[measure])
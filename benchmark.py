@@ -0,0 +1,285 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# Listings per borough are skewed the way the real export is; neighbourhood counts match NYC's ~220
+NEIGHBOURHOODS_PER_GROUP = {'Manhattan': 32, 'Brooklyn': 48, 'Queens': 51, 'Bronx': 48, 'Staten Island': 42}
+GROUP_SHARES = [0.43, 0.41, 0.13, 0.02, 0.01]
+ROOM_TYPES = ['Entire home/apt', 'Private room', 'Shared room', 'Hotel room']
+ROOM_SHARES = [0.53, 0.45, 0.015, 0.005]
+CANCELLATION_POLICIES = ['strict', 'moderate', 'flexible', '']
+
+# Rows generated at a time when writing large CSVs
+GENERATE_CHUNK_ROWS = 500_000
+
+
+# `n` listings with the columns and formatting of Airbnb_Open_Data.csv: "$1,234 " prices and fees,
+# mm/dd/yyyy review dates, Zipf-skewed neighbourhoods, blanks, minimum-nights and availability
+# outliers and ~2% exact duplicate rows
+def synthetic_listings(n, seed=0, first_id=1_000_000):
+    rng = np.random.default_rng(seed)
+    n_unique = n - n // 50
+
+    groups = rng.choice(list(NEIGHBOURHOODS_PER_GROUP), n_unique, p=GROUP_SHARES)
+    neighbourhoods = np.empty(n_unique, dtype=object)
+    for group, count in NEIGHBOURHOODS_PER_GROUP.items():
+        members = groups == group
+        weights = 1 / np.arange(1, count + 1)
+        picks = rng.choice(count, members.sum(), p=weights / weights.sum())
+        neighbourhoods[members] = [f"{group} {i + 1}" for i in picks]
+
+    price = rng.lognormal(6.2, 0.6, n_unique).clip(50, 1200).round().astype(int)
+    price[rng.random(n_unique) < 0.001] *= 20
+    fee = (price * 0.2).round().astype(int)
+    nights = np.where(rng.random(n_unique) < 0.01, rng.integers(200, 5000, n_unique),
+                      rng.integers(1, 30, n_unique))
+    nights[rng.random(n_unique) < 0.001] *= -1
+    reviewed = rng.random(n_unique) > 0.15
+    last_review = pd.to_datetime('2012-01-01') + pd.to_timedelta(rng.integers(0, 3650, n_unique), unit='D')
+
+    df = pd.DataFrame({
+        'id': np.arange(first_id, first_id + n_unique),
+        'NAME': [f"Listing {i}" for i in range(first_id, first_id + n_unique)],
+        'host id': rng.integers(10 ** 9, 10 ** 10, n_unique),
+        'host_identity_verified': rng.choice(['verified', 'unconfirmed'], n_unique),
+        'host name': 'Host',
+        'neighbourhood group': groups,
+        'neighbourhood': neighbourhoods,
+        'lat': 40.5 + rng.random(n_unique) * 0.4,
+        'long': -74.25 + rng.random(n_unique) * 0.55,
+        'country': np.where(rng.random(n_unique) < 0.005, '', 'United States'),
+        'country code': 'US',
+        'instant_bookable': rng.choice(['TRUE', 'FALSE', ''], n_unique, p=[0.45, 0.45, 0.1]),
+        'cancellation_policy': rng.choice(CANCELLATION_POLICIES, n_unique, p=[0.33, 0.33, 0.33, 0.01]),
+        'room type': rng.choice(ROOM_TYPES, n_unique, p=ROOM_SHARES),
+        'Construction year': rng.integers(2003, 2023, n_unique),
+        'price': [f"${p:,} " for p in price],
+        'service fee': [f"${f:,} " for f in fee],
+        'minimum nights': nights,
+        'number of reviews': np.where(reviewed, rng.geometric(0.03, n_unique), 0),
+        'last review': np.where(reviewed, last_review.strftime('%m/%d/%Y'), ''),
+        'reviews per month': np.where(reviewed, rng.exponential(1.4, n_unique).round(2), np.nan),
+        'review rate number': rng.integers(1, 6, n_unique),
+        'calculated host listings count': rng.geometric(0.3, n_unique),
+        'availability 365': rng.integers(-10, 420, n_unique),
+        'house_rules': 'No smoking',
+        'license': '',
+    })
+    blank_price = rng.random(n_unique) < 0.002
+    df.loc[blank_price, ['price', 'service fee']] = ''
+
+    duplicates = df.iloc[rng.choice(n_unique, n - n_unique)]
+    return pd.concat([df, duplicates], ignore_index=True).sample(frac=1, random_state=seed)
+
+
+# Write `n` synthetic listings to `path` in bounded chunks
+def write_synthetic_csv(path, n, seed=0):
+    written = 0
+    while written < n:
+        chunk = synthetic_listings(min(GENERATE_CHUNK_ROWS, n - written), seed + written, 1_000_000 + written)
+        chunk.to_csv(path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += len(chunk)
+    return path
+
+
+def _current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # ru_maxrss is KB on Linux, bytes on macOS; without /proc only the process high-water mark is known
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+# Highest RSS seen while the block runs, sampled from a background thread
+class PeakRss:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+
+    def _sample(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, _current_rss())
+            self._done.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss())
+
+
+def _measure(stage, size, repeat, run):
+    timings, peaks = [], []
+    for _ in range(repeat):
+        with PeakRss() as rss:
+            start = time.perf_counter()
+            rows = run()
+            timings.append(time.perf_counter() - start)
+        peaks.append(rss.peak)
+    seconds = statistics.median(timings)
+    return {'stage': stage, 'size': size, 'rows': rows, 'seconds': round(seconds, 6),
+            'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': round(max(peaks) / 2 ** 20, 1), 'repeat': repeat}
+
+
+# Detailed Insights sidebar combinations, from the defaults to every filter set
+def _insights_filters(df):
+    group = df['neighbourhood group'].value_counts().index[0]
+    neighbourhood = df.loc[df['neighbourhood group'] == group, 'neighbourhood'].value_counts().index[0]
+    return [
+        {},
+        {'neighbourhood_group': group, 'room_type': 'Entire home/apt'},
+        {'neighbourhood_group': group, 'neighbourhood': neighbourhood, 'instant_bookable': True,
+         'cancellation_policy': 'strict', 'min_nights': 2, 'max_price': 800},
+    ]
+
+
+# Runs every stage for one dataset size; executed in a fresh process so RSS figures are per size
+def run_size(size, workdir, repeat=3, seed=0):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    import queries
+    from chart_cache import figure_to_png
+    from data_loader import load_data
+    from dataset import Dataset
+    from histograms import plot_histogram
+
+    csv_path = write_synthetic_csv(os.path.join(workdir, f"listings_{size}.csv"), size, seed)
+    snapshot_dir = os.path.join(workdir, f"snapshot_{size}")
+    results = []
+
+    def cold_load():
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        return size if len(load_data(csv_path, snapshot_dir)) else 0
+
+    results.append(_measure('load_data_cold', size, repeat, cold_load))
+    state = {}
+
+    def warm_load():
+        state['df'] = load_data(csv_path, snapshot_dir)
+        return size
+
+    results.append(_measure('load_data_snapshot', size, repeat, warm_load))
+    df = state['df']
+
+    def build():
+        state['dataset'] = Dataset(df)
+        return len(df)
+
+    results.append(_measure('build_indexes', size, repeat, build))
+    dataset = state['dataset']
+
+    filters = _insights_filters(df)
+
+    def insights():
+        for selection in filters:
+            rows = queries.detailed_insights_rows(dataset, **selection)
+            queries.detailed_insights_totals(dataset, rows)
+            state['rows'] = rows
+        return len(df) * len(filters)
+
+    results.append(_measure('insights_filters', size, repeat, insights))
+
+    budget_nights = [(600, 1), (1500, 3), (4000, 7)]
+    group, neighbourhood = filters[2]['neighbourhood_group'], filters[2]['neighbourhood']
+
+    def recommendation():
+        for budget, nights in budget_nights:
+            queries.recommendations(dataset, group, neighbourhood, budget, nights)
+        return len(df) * len(budget_nights)
+
+    results.append(_measure('recommendation_filter', size, repeat, recommendation))
+
+    def charts():
+        for measure, bins in [('price', 30), ('availability 365', 20), ('number of reviews', 30)]:
+            fig, ax = plt.subplots(figsize=(10, 6))
+            plot_histogram(ax, dataset.histograms.histogram(measure, rows=state['rows']), bins, 'blue')
+            figure_to_png(fig)
+        fig, ax = plt.subplots(figsize=(10, 6))
+        queries.comparative(dataset, 'top_neighbourhoods_by_price').plot(kind='bar', ax=ax)
+        figure_to_png(fig)
+        return len(df)
+
+    results.append(_measure('chart_render', size, repeat, charts))
+    os.remove(csv_path)
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return results
+
+
+# Stages whose time grew by more than `tolerance` (0.2 = 20%) over the baseline results
+def regressions(results, baseline, tolerance=0.2):
+    previous = {(r['stage'], r['size']): r['seconds'] for r in baseline}
+    slower = []
+    for result in results:
+        before = previous.get((result['stage'], result['size']))
+        if before and result['seconds'] > before * (1 + tolerance):
+            slower.append({**result, 'baseline_seconds': before})
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the dashboard stages on synthetic listings")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="write results as JSON here instead of stdout")
+    parser.add_argument('--baseline', help="earlier --output file; exit 1 if any stage regressed")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--workdir', help="where synthetic CSVs and snapshots go (default: a temp dir)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='airbnb-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    # One process per size, so each size's peak RSS is its own
+    context = multiprocessing.get_context('spawn')
+    try:
+        for size in args.sizes:
+            with context.Pool(1) as pool:
+                results += pool.apply(run_size, (size, workdir, args.repeat))
+            print(f"{size} rows done", file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for result in slower:
+            print(f"REGRESSION {result['stage']} @ {result['size']}: {result['baseline_seconds']}s -> "
+                  f"{result['seconds']}s", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from filters import ALL
+
+# Columns the pages offer as dropdowns
+OPTION_COLUMNS = ['country', 'neighbourhood group', 'neighbourhood', 'room type', 'cancellation_policy']
+
+# Columns the pages put on sliders
+NUMERIC_COLUMNS = ['minimum nights', 'price', 'service fee', 'availability 365']
+
+# Narrowed option lists remembered per catalog; the pages only produce a few hundred combinations
+MAX_CACHED_OPTIONS = 4096
+
+
+def _codes(series):
+    if series.dtype == 'category':
+        return series.cat.codes.to_numpy(), list(series.cat.categories)
+    codes, uniques = pd.factorize(series)
+    return codes, list(uniques)
+
+
+# Widget metadata for one dataset version: sorted distinct values per dropdown column, the neighbourhood
+# group -> neighbourhoods hierarchy and min/max/median per slider column, all computed once. options()
+# narrows a dropdown to the values that still have listings under the other current selections, filtered
+# on `engine` (see engines.py, or a FilterIndex).
+class Catalog:
+    def __init__(self, df, engine):
+        self.engine = engine
+        self.codes = {}
+        self.categories = {}
+        self.values = {}
+        for col in OPTION_COLUMNS:
+            if col not in df.columns:
+                continue
+            self.codes[col], self.categories[col] = _codes(df[col])
+            self.values[col] = self._present(col, self.codes[col])
+
+        self.neighbourhoods = {}
+        if 'neighbourhood group' in self.codes and 'neighbourhood' in self.codes:
+            groups, neighbourhoods = self.codes['neighbourhood group'], self.codes['neighbourhood']
+            located = (groups >= 0) & (neighbourhoods >= 0)
+            width = len(self.categories['neighbourhood'])
+            pairs = np.unique(groups[located].astype(np.int64) * width + neighbourhoods[located])
+            for group_code, neighbourhood_code in zip(pairs // width, pairs % width):
+                group = self.categories['neighbourhood group'][group_code]
+                self.neighbourhoods.setdefault(group, []).append(self.categories['neighbourhood'][neighbourhood_code])
+            for group in self.neighbourhoods:
+                self.neighbourhoods[group].sort()
+
+        self.numeric = {}
+        for col in NUMERIC_COLUMNS:
+            if col in df.columns:
+                values = df[col]
+                self.numeric[col] = {'min': values.min(), 'max': values.max(), 'median': values.median()}
+
+        self._options = {}
+        self._lock = threading.Lock()
+
+    def _present(self, column, codes):
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.categories[column]))
+        return sorted(self.categories[column][i] for i in np.flatnonzero(counts))
+
+    # Sorted values of `column` that have at least one listing matching every other selection in
+    # `selections` ((column, value) pairs, 'All' ignored)
+    def options(self, column, selections=()):
+        others = tuple((col, value) for col, value in selections if col != column and value != ALL)
+        if not others:
+            return self.values[column]
+        key = (column, others)
+        with self._lock:
+            cached = self._options.get(key)
+        if cached is None:
+            rows = self.engine.select(equals=others)
+            cached = self._present(column, self.codes[column][rows])
+            with self._lock:
+                if len(self._options) >= MAX_CACHED_OPTIONS:
+                    self._options.clear()
+                self._options[key] = cached
+        return cached
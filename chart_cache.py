@@ -0,0 +1,75 @@
+import io
+import threading
+from collections import OrderedDict
+
+# Rendered PNGs kept per process; override with ChartCache(max_bytes=...)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Same output st.pyplot produces, so cached images look identical
+SAVEFIG_OPTIONS = {'format': 'png', 'bbox_inches': 'tight', 'dpi': 200}
+
+
+def figure_to_png(fig):
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **SAVEFIG_OPTIONS)
+    # Drop the figure from pyplot's registry, otherwise every render leaks one
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+# Filter values in a stable, hashable form: dicts by key, lists as tuples, numpy scalars as Python ones
+def normalize_filters(filters):
+    if isinstance(filters, dict):
+        return tuple(sorted((key, normalize_filters(value)) for key, value in filters.items()))
+    if isinstance(filters, (list, tuple)):
+        return tuple(normalize_filters(value) for value in filters)
+    if hasattr(filters, 'item'):
+        return filters.item()
+    return filters
+
+
+# LRU cache of rendered chart PNGs keyed by (chart id, dataset version, filters), bounded by total bytes.
+# Shared by all sessions, so access goes through a lock.
+class ChartCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= len(self._entries.pop(key))
+            if len(png) > self.max_bytes:
+                return
+            self._entries[key] = png
+            self.current_bytes += len(png)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    @staticmethod
+    def key(chart_id, version, filters=()):
+        return chart_id, version, normalize_filters(filters)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
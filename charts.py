@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import sys
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from chart_cache import figure_to_png
+from histograms import plot_histogram
+
+
+# Charts are plain data (kind, what to draw, figure size, style, axis labels) so they can be pickled
+# to a worker process and rasterized there; matplotlib is not thread-safe, processes are. matplotlib
+# itself (~0.5 s to import) is only imported where a chart is actually rendered.
+
+# `series.plot(kind=plot, **style)` (a Series, or a DataFrame for one line per column); `axes` takes xlabel,
+# ylabel, title, fontsize (labels) and ticksize
+def series_chart(series, plot, figsize, style=None, **axes):
+    return {'kind': 'series', 'data': series, 'plot': plot, 'figsize': figsize, 'style': style or {}, 'axes': axes}
+
+
+# `ax.pie(sizes, labels=labels, **style)` drawn as a circle
+def pie_chart(sizes, labels, figsize, **style):
+    return {'kind': 'pie', 'data': (list(sizes), list(labels)), 'figsize': figsize, 'style': style, 'axes': {}}
+
+
+# Pre-binned Histogram drawn with `bins` bars and its KDE line
+def histogram_chart(hist, bins, color, figsize, **axes):
+    return {'kind': 'histogram', 'data': (hist, bins), 'figsize': figsize, 'style': {'color': color}, 'axes': axes}
+
+
+def _label_axes(ax, xlabel=None, ylabel=None, title=None, fontsize=None, ticksize=None):
+    text = {'fontsize': fontsize} if fontsize else {}
+    if xlabel is not None:
+        ax.set_xlabel(xlabel, **text)
+    if ylabel is not None:
+        ax.set_ylabel(ylabel, **text)
+    if title is not None:
+        ax.set_title(title, **text)
+    if ticksize:
+        ax.tick_params(axis='both', labelsize=ticksize)
+
+
+def render(spec):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=spec['figsize'])
+    if spec['kind'] == 'series':
+        spec['data'].plot(kind=spec['plot'], ax=ax, **spec['style'])
+    elif spec['kind'] == 'pie':
+        sizes, labels = spec['data']
+        ax.pie(sizes, labels=labels, **spec['style'])
+        ax.axis('equal')  # Equal aspect ratio ensures the pie chart is circular.
+    elif spec['kind'] == 'histogram':
+        hist, bins = spec['data']
+        plot_histogram(ax, hist, bins, spec['style']['color'])
+    else:
+        plt.close(fig)
+        raise ValueError(f"unknown chart kind {spec['kind']!r}")
+    _label_axes(ax, **spec['axes'])
+    return fig
+
+
+def _init_worker():
+    import matplotlib
+
+    matplotlib.use('Agg')
+
+
+# Worker entry point: PNG bytes plus the seconds spent rendering them
+def render_png(spec):
+    start = time.perf_counter()
+    png = figure_to_png(render(spec))
+    return png, time.perf_counter() - start
+
+
+# Rasterizes chart specs concurrently in worker processes. With one worker, or if the pool breaks,
+# charts are rendered in the calling process instead.
+class ChartPool:
+    def __init__(self, workers=None):
+        self.workers = workers if workers is not None else min(4, os.cpu_count() or 1)
+        self._executor = None
+        if self.workers > 1:
+            # spawn: forking a multi-threaded server process is unsafe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker)
+            self._start_workers()
+
+    # Spawned children re-import the parent's __main__ module. Under Streamlit that is the dashboard
+    # script itself, so every worker would re-run the whole page while bootstrapping. The workers are
+    # therefore all started up front (one no-op task each) with a bare __main__ in place.
+    def _start_workers(self):
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            started = [self._executor.submit(time.perf_counter) for _ in range(self.workers)]
+        finally:
+            sys.modules['__main__'] = main
+        for future in started:
+            future.result()
+
+    # Yields (key, png, seconds) for each {key: spec} item, in completion order
+    def render_many(self, specs):
+        if self._executor is None or len(specs) < 2:
+            for key, spec in specs.items():
+                yield (key, *render_png(spec))
+            return
+        remaining = dict(specs)
+        try:
+            futures = {self._executor.submit(render_png, spec): key for key, spec in specs.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                png, seconds = future.result()
+                del remaining[key]
+                yield key, png, seconds
+        except BrokenProcessPool:
+            self._executor = None
+            for key, spec in remaining.items():
+                yield (key, *render_png(spec))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,48 @@
+import pandas as pd
+
+
+# Row-local cleaning steps; safe to apply to each chunk of a streamed CSV on its own
+def parse_columns(df):
+    df['price'] = df['price'].replace(r'[\$,]', '', regex=True).astype(float)
+    df['service fee'] = df['service fee'].replace(r'[\$,]', '', regex=True).astype(float)
+    df['last review'] = pd.to_datetime(df['last review'], errors='coerce')
+    df.fillna({'reviews per month': 0, 'number of reviews': 0}, inplace=True)
+    df.drop(columns=['license'], errors='ignore', inplace=True)
+
+    # Ensure required columns exist
+    required_columns = ['cancellation_policy', 'instant_bookable']
+    for col in required_columns:
+        if col not in df.columns:
+            df[col] = 'Unknown'
+    df.fillna({'cancellation_policy': 'Unknown', 'instant_bookable': 'Unknown'}, inplace=True)
+    return df
+
+
+# Rows kept by the minimum-nights outlier filter, given the 99th-percentile cutoff
+def within_nights_cutoff(df, cutoff):
+    return (df['minimum nights'] >= 1) & (df['minimum nights'] <= cutoff)
+
+
+# Same cleaning steps the dashboard has always applied to the raw export
+def clean_data(df):
+    df = parse_columns(df)
+
+    # Remove exact duplicate rows
+    df = df.drop_duplicates()
+
+    # Handle extreme outliers in minimum nights
+    cutoff = df['minimum nights'].quantile(0.99)
+    df = df[within_nights_cutoff(df, cutoff)].reset_index(drop=True)
+
+    # Kept so incremental updates can apply the same cutoff to new rows
+    df.attrs['nights_cutoff'] = float(cutoff)
+    return df
+
+
+# Arrow needs one type per column; mixed object columns (e.g. True/False/'Unknown') are stored as strings
+def arrow_safe(df):
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col]
+            df[col] = values.where(values.isna(), values.astype(str))
+    return df
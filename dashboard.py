@@ -1,36 +1,129 @@
-import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-
-# Load cleaned dataset
-def load_data():
-    file_path = "Airbnb_Open_Data.csv"
-    df = pd.read_csv(file_path)
-    df['price'] = df['price'].replace('[\$,]', '', regex=True).astype(float)
-    df['service fee'] = df['service fee'].replace('[\$,]', '', regex=True).astype(float)
-    df['last review'] = pd.to_datetime(df['last review'], errors='coerce')
-    df.fillna({'reviews per month': 0, 'number of reviews': 0}, inplace=True)
-    df.drop(columns=['license'], errors='ignore', inplace=True)
-
-    # Ensure required columns exist
-    required_columns = ['cancellation_policy', 'instant_bookable']
-    for col in required_columns:
-        if col not in df.columns:
-            df[col] = 'Unknown'
-    df.fillna({'cancellation_policy': 'Unknown', 'instant_bookable': 'Unknown'}, inplace=True)
+import calendar
+import os
+import time
 
-    # Remove exact duplicate rows
-    df = df.drop_duplicates()
-
-    # Handle extreme outliers in minimum nights
-    df = df[(df['minimum nights'] >= 1) & (df['minimum nights'] <= df['minimum nights'].quantile(0.99))]
+import pydeck as pdk
+import streamlit as st
+import numpy as np
+
+import diagnostics
+from chart_cache import ChartCache
+from charts import ChartPool, histogram_chart, pie_chart, series_chart
+from filters import ALL
+from queries import (approximate_insights_totals, availability_bands, comparative, dashboard_kpis, density_tiles,
+                     detailed_insights_rows, detailed_insights_totals, listings_overview_rows, recommendations,
+                     review_trends, sampled_insights_rows, value_counts)
+from recommender import WIDENING
+from spatial import TILE_ZOOMS
+from timeseries import FREQUENCIES, FREQUENCY_NAMES, TREND_DIMENSIONS, TREND_MEASURES
+from warmup import Warmup
+
+
+# One cleaned dataset per server process, shared read-only by every session, plus its filter index,
+# aggregate cube and histogram store. Pages must never modify it; filters select row positions and
+# take only the columns they plot. Delta exports dropped into deltas/ are folded in on the next rerun.
+# The first run starts loading it in the background; pages draw placeholders until it is ready.
+@st.cache_resource
+def get_warmup():
+    return Warmup()
+
+
+# Rendered chart PNGs shared across sessions; budget in MB via CHART_CACHE_MB
+@st.cache_resource
+def get_chart_cache():
+    return ChartCache(max_bytes=int(float(os.environ.get('CHART_CACHE_MB', 64)) * 1024 * 1024))
+
+
+# Worker processes rasterizing charts concurrently; size via CHART_WORKERS (1 renders in-process)
+@st.cache_resource
+def get_chart_pool():
+    workers = os.environ.get('CHART_WORKERS')
+    return ChartPool(int(workers) if workers else None)
+
+
+# Every rerun is traced; the Diagnostics sidebar section (?diagnostics=1 or DASHBOARD_DIAGNOSTICS=1) shows the
+# per-stage breakdown and exports it as a Chrome trace
+trace = diagnostics.start()
+warmup = get_warmup()
+if warmup.error is not None:
+    # Let the next run try again instead of keeping the failed load
+    get_warmup.clear()
+with diagnostics.span('refresh dataset', 'load'):
+    dataset = warmup.refresh()
+chart_cache = get_chart_cache()
+pending_charts = {}
+exact_rerun_pending = False
+
+
+# Show a chart from the cache, or reserve its place and queue its spec for draw_pending_charts().
+# `build` returns the chart spec; `filters` must capture everything it depends on besides df.
+def show_chart(chart_id, build, filters=()):
+    key = chart_cache.key(chart_id, dataset.version, filters)
+    png = chart_cache.get(key)
+    if png is not None:
+        st.image(png, width='stretch')
+        return
+    with diagnostics.span(chart_id, 'chart'):
+        pending_charts[key] = (build(), st.empty())
+
+
+# Rasterize the queued charts in the worker pool and fill each placeholder as its PNG arrives, so the
+# page is complete after the slowest chart rather than the sum of all of them
+def draw_pending_charts():
+    specs = {key: spec for key, (spec, _) in pending_charts.items()}
+    chart_pool = get_chart_pool()
+    with diagnostics.span('render charts', 'chart', len(specs)):
+        submitted = time.perf_counter()
+        for key, png, seconds in chart_pool.render_many(specs):
+            chart_cache.put(key, png)
+            pending_charts[key][1].image(png, width='stretch')
+            diagnostics.record(f"{key[0]} render", 'chart', submitted, seconds, size=len(png))
+    pending_charts.clear()
+
+
+# Selectbox over the values of `column` that have listings under `selections`, the (column, value) pairs
+# chosen by the dropdowns above it; appends its own choice to `selections`
+def option_selectbox(container, label, column, selections, **kwargs):
+    value = container.selectbox(label, [ALL] + catalog.options(column, selections), **kwargs)
+    selections.append((column, value))
+    return value
+
+
+# The four headline metric boxes of the Dashboard page
+def show_kpis(kpis):
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.markdown('<div class="metric-box">'
+                    '<h3>Total Listings</h3>'
+                    f'<p style="font-size: 20px; color: #2E86C1;">{kpis["total_listings"]}</p>'
+                    '</div>', unsafe_allow_html=True)
+    with col2:
+        st.markdown('<div class="metric-box">'
+                    '<h3>Average Price</h3>'
+                    f'<p style="font-size: 20px; color: #E74C3C;">${kpis["average_price"]:.2f}</p>'
+                    '</div>', unsafe_allow_html=True)
+    with col3:
+        st.markdown('<div class="metric-box">'
+                    '<h3>Average Availability</h3>'
+                    f'<p style="font-size: 20px; color: #27AE60;">{kpis["average_availability"]:.1f} days/year</p>'
+                    '</div>', unsafe_allow_html=True)
+    with col4:
+        st.markdown('<div class="metric-box">'
+                    '<h3>Total Reviews</h3>'
+                    f'<p style="font-size: 20px; color: #8E44AD;">{kpis["total_reviews"]}</p>'
+                    '</div>', unsafe_allow_html=True)
 
-    return df
 
+# Pydeck map of listing counts per tile (one circle per tile, never one per listing)
+def density_deck(tiles, zoom):
+    tiles = tiles.assign(radius=20037508 * np.cos(np.radians(tiles['lat'])) / 2 ** zoom,
+                         alpha=(60 + 195 * tiles['count'] / max(tiles['count'].max(), 1)).astype(int))
+    layer = pdk.Layer('ScatterplotLayer', data=tiles, id='density', get_position=['long', 'lat'], get_radius='radius',
+                      get_fill_color=[231, 76, 60, 'alpha'], pickable=True)
+    view = pdk.ViewState(latitude=float(tiles['lat'].mean()) if len(tiles) else 40.7,
+                         longitude=float(tiles['long'].mean()) if len(tiles) else -73.95, zoom=zoom - 1)
+    return pdk.Deck(layers=[layer], initial_view_state=view, tooltip={'text': '{count} listings'})
 
-df = load_data()
 
 # Custom CSS for modern and clean styling
 st.markdown("""
@@ -155,30 +248,28 @@ st.title("Airbnb Booking Insights Dashboard")
 menu = st.sidebar.radio("Select Analysis Section", [
     "Dashboard", "Listings Overview", "Detailed Insights", "Comparative Analysis", "Recommendation"
 ])
+trace.label = menu
+
+# Still loading: the KPIs from the last persisted summary (Dashboard page) and placeholders, meanwhile
+# starting the chart workers; then wait for the data and rerun, which fills in the full page
+if dataset is None:
+    if menu == "Dashboard":
+        summary = warmup.summary()
+        if summary is not None:
+            show_kpis(summary['kpis'])
+            st.caption("As of the last load; refreshing with the latest data…")
+    st.info("Loading listings… charts will appear as soon as the data is ready.")
+    get_chart_pool()
+    diagnostics.stop()
+    warmup.wait()
+    st.rerun()
+
+df = dataset.df
+catalog = dataset.catalog
+histogram_store = dataset.histograms
 
 if menu == "Dashboard":
-
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.markdown('<div class="metric-box">'
-                    '<h3>Total Listings</h3>'
-                    f'<p style="font-size: 20px; color: #2E86C1;">{df.shape[0]}</p>'
-                    '</div>', unsafe_allow_html=True)
-    with col2:
-        st.markdown('<div class="metric-box">'
-                    '<h3>Average Price</h3>'
-                    f'<p style="font-size: 20px; color: #E74C3C;">${df["price"].mean():.2f}</p>'
-                    '</div>', unsafe_allow_html=True)
-    with col3:
-        st.markdown('<div class="metric-box">'
-                    '<h3>Average Availability</h3>'
-                    f'<p style="font-size: 20px; color: #27AE60;">{df["availability 365"].mean():.1f} days/year</p>'
-                    '</div>', unsafe_allow_html=True)
-    with col4:
-        st.markdown('<div class="metric-box">'
-                    '<h3>Total Reviews</h3>'
-                    f'<p style="font-size: 20px; color: #8E44AD;">{df["number of reviews"].sum()}</p>'
-                    '</div>', unsafe_allow_html=True)
+    show_kpis(dashboard_kpis(dataset))
 
     # Row 1: Full-width Pie Chart with Legend
     st.markdown('<div class="chart-box">'
@@ -187,14 +278,15 @@ if menu == "Dashboard":
     col1, col2 = st.columns([2, 1])
     with col1:
         # Cancellation Policy Distribution
-        labels = df['cancellation_policy'].value_counts().index
-        sizes = df['cancellation_policy'].value_counts().values
+        cancellation_counts = value_counts(dataset, 'cancellation_policy')
+        labels = cancellation_counts.index
+        sizes = cancellation_counts.values
         colors = ['#2E86C1', '#E74C3C', '#27AE60', '#8E44AD', '#F1C40F'][:len(labels)]  # Dynamically adjust colors
 
-        fig, ax = plt.subplots(figsize=(2, 1))
-        ax.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%', startangle=90, textprops={'fontsize': 4})
-        ax.axis('equal')  # Equal aspect ratio ensures the pie chart is circular.
-        st.pyplot(fig)
+        def chart_cancellation_pie():
+            return pie_chart(sizes, labels, (2, 1), colors=colors, autopct='%1.1f%%', startangle=90,
+                             textprops={'fontsize': 4})
+        show_chart('dashboard.cancellation_pie', chart_cancellation_pie)
 
     with col2:
         st.markdown("### Cancellation Policy Distribution")
@@ -208,21 +300,19 @@ if menu == "Dashboard":
         st.markdown('<div class="chart-box">'
                     '<h3>Price Distribution</h3>'
                     '</div>', unsafe_allow_html=True)
-        fig, ax = plt.subplots(figsize=(4, 3))
-        sns.histplot(df['price'], bins=30, kde=True, color='#2E86C1', ax=ax)
-        ax.set_xlabel("Price ($)")
-        ax.set_ylabel("Number of Listings")
-        st.pyplot(fig)
+        def chart_price_hist():
+            return histogram_chart(histogram_store.histogram('price'), 30, '#2E86C1', (4, 3),
+                                   xlabel="Price ($)", ylabel="Number of Listings")
+        show_chart('dashboard.price_hist', chart_price_hist)
 
     with col2:
         st.markdown('<div class="chart-box">'
                     '<h3>Room Type Distribution</h3>'
                     '</div>', unsafe_allow_html=True)
-        fig, ax = plt.subplots(figsize=(4, 3))
-        df['room type'].value_counts().plot(kind='pie', autopct='%1.1f%%', colors=['#E74C3C', '#27AE60', '#8E44AD'],
-                                            ax=ax)
-        ax.set_ylabel("")
-        st.pyplot(fig)
+        def chart_room_type_pie():
+            return series_chart(value_counts(dataset, 'room type'), 'pie', (4, 3),
+                                {'autopct': '%1.1f%%', 'colors': ['#E74C3C', '#27AE60', '#8E44AD']}, ylabel="")
+        show_chart('dashboard.room_type_pie', chart_room_type_pie)
 
     # Row 3: Three-column layout for Availability, Reviews, and Top Neighbourhoods
     col1, col2, col3 = st.columns(3)
@@ -230,32 +320,29 @@ if menu == "Dashboard":
         st.markdown('<div class="chart-box">'
                     '<h3>Availability Distribution</h3>'
                     '</div>', unsafe_allow_html=True)
-        fig, ax = plt.subplots(figsize=(3, 2))
-        sns.histplot(df['availability 365'], bins=20, kde=True, color='#2E86C1', ax=ax)
-        ax.set_xlabel("Availability (Days per Year)")
-        ax.set_ylabel("Number of Listings")
-        st.pyplot(fig)
+        def chart_availability_hist():
+            return histogram_chart(histogram_store.histogram('availability 365'), 20, '#2E86C1', (3, 2),
+                                   xlabel="Availability (Days per Year)", ylabel="Number of Listings")
+        show_chart('dashboard.availability_hist', chart_availability_hist)
 
     with col2:
         st.markdown('<div class="chart-box">'
                     '<h3>Reviews Distribution</h3>'
                     '</div>', unsafe_allow_html=True)
-        fig, ax = plt.subplots(figsize=(3, 2))
-        sns.histplot(df['number of reviews'], bins=20, kde=True, color='#E74C3C', ax=ax)
-        ax.set_xlabel("Number of Reviews")
-        ax.set_ylabel("Number of Listings")
-        st.pyplot(fig)
+        def chart_reviews_hist():
+            return histogram_chart(histogram_store.histogram('number of reviews'), 20, '#E74C3C', (3, 2),
+                                   xlabel="Number of Reviews", ylabel="Number of Listings")
+        show_chart('dashboard.reviews_hist', chart_reviews_hist)
 
     with col3:
         st.markdown('<div class="chart-box">'
                     '<h3>Top Neighbourhood Groups by Average Price</h3>'
                     '</div>', unsafe_allow_html=True)
-        top_neighbourhood_price = df.groupby('neighbourhood group')['price'].mean().sort_values(ascending=False).head(5)
-        fig, ax = plt.subplots(figsize=(3, 2))
-        top_neighbourhood_price.plot(kind='bar', color='#27AE60', ax=ax)
-        ax.set_ylabel("Average Price ($)")
-        ax.set_xlabel("Neighbourhood Group")
-        st.pyplot(fig)
+        def chart_top_groups_price():
+            top_neighbourhood_price = comparative(dataset, 'top_groups_by_price')
+            return series_chart(top_neighbourhood_price, 'bar', (3, 2), {'color': '#27AE60'},
+                                ylabel="Average Price ($)", xlabel="Neighbourhood Group")
+        show_chart('dashboard.top_groups_price', chart_top_groups_price)
 
 # Rest of the code for other pages remains unchanged...
 
@@ -264,119 +351,126 @@ elif menu == "Listings Overview":
 
     # Searchable Dropdowns
     st.subheader("Available Locations")
-    selected_country = st.selectbox("Search Country", ['All'] + sorted(df['country'].dropna().unique().tolist()))
-    selected_neighbourhood_group = st.selectbox("Search Neighbourhood Group",
-                                                ['All'] + sorted(df['neighbourhood group'].dropna().unique().tolist()))
-    selected_neighbourhood = st.selectbox("Search Neighbourhood",
-                                          ['All'] + sorted(df['neighbourhood'].dropna().unique().tolist()))
-    selected_room_type = st.selectbox("Search Room Type", ['All'] + sorted(df['room type'].dropna().unique().tolist()))
+    # Each dropdown only offers values that still have listings under the selections above it
+    selections = []
+    selected_country = option_selectbox(st, "Search Country", 'country', selections)
+    selected_neighbourhood_group = option_selectbox(st, "Search Neighbourhood Group", 'neighbourhood group', selections)
+    selected_neighbourhood = option_selectbox(st, "Search Neighbourhood", 'neighbourhood', selections)
+    selected_room_type = option_selectbox(st, "Search Room Type", 'room type', selections)
+
+    # Map of matching listings per tile; selecting tiles limits the insights below to those areas
+    st.subheader("Listings Map")
+    zoom = st.select_slider("Map Detail", options=TILE_ZOOMS, value=TILE_ZOOMS[1])
+    # Merged from per-selector tile counts (or the overall counts when every selector is All)
+    selector_cells = {'country': selected_country, 'neighbourhood group': selected_neighbourhood_group,
+                      'neighbourhood': selected_neighbourhood, 'room type': selected_room_type}
+    map_event = st.pydeck_chart(density_deck(density_tiles(dataset, zoom, where=selector_cells), zoom),
+                                on_select='rerun', selection_mode='multi-object', key=f'listings_map_{zoom}')
+    selected_tiles = map_event.selection['objects'].get('density', []) if map_event else []
+    boxes = tuple((tile['south'], tile['west'], tile['north'], tile['east']) for tile in selected_tiles)
 
     # Apply filters to the dataset
-    filtered_df = df.copy()
-    if selected_country != 'All':
-            filtered_df = filtered_df[filtered_df['country'] == selected_country]
-    if selected_neighbourhood_group != 'All':
-        filtered_df = filtered_df[filtered_df['neighbourhood group'] == selected_neighbourhood_group]
-    if selected_neighbourhood != 'All':
-        filtered_df = filtered_df[filtered_df['neighbourhood'] == selected_neighbourhood]
-    if selected_room_type != 'All':
-        filtered_df = filtered_df[filtered_df['room type'] == selected_room_type]
+    rows = listings_overview_rows(dataset, selected_country, selected_neighbourhood_group, selected_neighbourhood,
+                                  selected_room_type, boxes)
+    if boxes:
+        st.caption(f"{len(rows)} listings in {len(boxes)} selected map tiles")
+    page_filters = (selected_country, selected_neighbourhood_group, selected_neighbourhood, selected_room_type, boxes)
 
     # Availability Insights
     st.subheader("Availability Insights")
-    availability_bins = pd.cut(filtered_df['availability 365'], bins=[0, 100, 200, 300, 365],
-                               labels=["0-100", "101-200", "201-300", "301-365"])
-    availability_counts = availability_bins.value_counts().sort_index()
-
-    fig, ax = plt.subplots(figsize=(3, 2))
-    availability_counts.plot(kind='bar', color='blue', ax=ax)
-    ax.set_ylabel("Number of Listings", fontsize=5)
-    ax.set_xlabel("Availability Range (Days per Year)", fontsize=5)
-    ax.set_title("Availability Distribution Across Listings", fontsize=5)
-    ax.tick_params(axis='both', labelsize=4)
-    st.pyplot(fig)
+    availability_counts = availability_bands(dataset, rows)
+
+    def chart_availability_bins():
+        return series_chart(availability_counts, 'bar', (3, 2), {'color': 'blue'}, ylabel="Number of Listings",
+                            xlabel="Availability Range (Days per Year)",
+                            title="Availability Distribution Across Listings", fontsize=5, ticksize=4)
+    show_chart('listings.availability_bins', chart_availability_bins, page_filters)
 
 if menu == "Detailed Insights":
     st.header("Detailed Insights")
 
     st.sidebar.header("Filter Options")
-    selected_country = st.sidebar.selectbox("Select Country", ['All'] + list(df['country'].unique()))
-    selected_neighbourhood_group = st.sidebar.selectbox("Select Neighbourhood Group",
-                                                        ['All'] + list(df['neighbourhood group'].unique()))
+    selections = []
+    selected_country = option_selectbox(st.sidebar, "Select Country", 'country', selections)
+    selected_neighbourhood_group = option_selectbox(st.sidebar, "Select Neighbourhood Group", 'neighbourhood group',
+                                                    selections)
+    selected_neighbourhood = option_selectbox(st.sidebar, "Select Neighbourhood", 'neighbourhood', selections)
+    selected_room_type = option_selectbox(st.sidebar, "Select Room Type", 'room type', selections)
 
-    if selected_neighbourhood_group != 'All':
-        available_neighbourhoods = df[df['neighbourhood group'] == selected_neighbourhood_group][
-            'neighbourhood'].unique()
+    instant_book = st.sidebar.checkbox("Instant Bookable")
+    cancellation_policy = option_selectbox(st.sidebar, "Cancellation Policy", 'cancellation_policy', selections,
+                                           format_func=str.capitalize)
+
+    nights_bounds = catalog.numeric['minimum nights']
+    price_bounds = catalog.numeric['price']
+    min_nights = st.sidebar.slider("Minimum Nights", int(nights_bounds['min']), int(nights_bounds['max']),
+                                   int(nights_bounds['median']))
+    max_price = st.sidebar.slider("Maximum Price", int(price_bounds['min']), int(price_bounds['max']),
+                                  int(price_bounds['median']))
+
+    approximate = st.sidebar.toggle("Approximate While Exploring",
+                                    value=os.environ.get('DASHBOARD_APPROXIMATE') == '1',
+                                    help="Answer from a stratified sample, with 95% confidence intervals, while the "
+                                         "filters are changing; exact results follow once they settle.")
+
+    page_filters = (selected_country, selected_neighbourhood_group, selected_neighbourhood, selected_room_type,
+                    instant_book, cancellation_policy, min_nights, max_price)
+    # In approximate mode a rerun with changed filters is answered from the sample; the page reruns itself
+    # with exact results once the filters have been left alone for APPROXIMATE_IDLE_SECONDS (default 1)
+    exploring = approximate and st.session_state.get('insights_filters') != page_filters
+    st.session_state['insights_filters'] = page_filters
+    exact_rerun_pending = exploring
+
+    # cancellation_policy is filled with 'Unknown' at load time, so the shared frame is never modified here
+    if exploring:
+        rows = sampled_insights_rows(dataset, *page_filters)
+        totals = approximate_insights_totals(dataset, rows, *page_filters)
     else:
-        available_neighbourhoods = df['neighbourhood'].unique()
+        rows = detailed_insights_rows(dataset, *page_filters)
+        totals = detailed_insights_totals(dataset, rows)
 
-    selected_neighbourhood = st.sidebar.selectbox("Select Neighbourhood", ['All'] + list(available_neighbourhoods))
-    selected_room_type = st.sidebar.selectbox("Select Room Type", ['All'] + list(df['room type'].unique()))
+    def show_total(label, total):
+        if exploring:
+            st.write(f"{label}: ≈ {total.value:,.0f} ± {total.margin:,.0f} (95% CI)")
+        else:
+            st.write(f"{label}: {total}")
 
-    instant_book = st.sidebar.checkbox("Instant Bookable")
-    cancellation_policy = st.sidebar.selectbox("Cancellation Policy",
-                                               ['All', 'Strict', 'Moderate', 'Flexible', 'Unknown'])
+    # Histogram of `measure` over the filtered rows, estimated with error bars while exploring
+    def insights_histogram(measure):
+        if exploring:
+            return dataset.sample.histogram(measure, rows)
+        return histogram_store.histogram(measure, rows=rows)
 
-    # Ensure the 'cancellation_policy' column exists and fill missing values with 'Unknown'
-    if 'cancellation_policy' in df.columns:
-        df['cancellation_policy'].fillna('Unknown', inplace=True)
-    else:
-        st.error("Column 'cancellation_policy' not found in the dataset.")
-
-    min_nights = st.sidebar.slider("Minimum Nights", int(df['minimum nights'].min()), int(df['minimum nights'].max()),
-                                   int(df['minimum nights'].median()))
-    max_price = st.sidebar.slider("Maximum Price", int(df['price'].min()), int(df['price'].max()),
-                                  int(df['price'].median()))
-
-    filtered_df = df.copy()
-    if selected_country != 'All':
-        filtered_df = filtered_df[filtered_df['country'] == selected_country]
-    if selected_neighbourhood_group != 'All':
-        filtered_df = filtered_df[filtered_df['neighbourhood group'] == selected_neighbourhood_group]
-    if selected_neighbourhood != 'All':
-        filtered_df = filtered_df[filtered_df['neighbourhood'] == selected_neighbourhood]
-    if selected_room_type != 'All':
-        filtered_df = filtered_df[filtered_df['room type'] == selected_room_type]
-    if instant_book:
-        filtered_df = filtered_df[filtered_df['instant_bookable'] == 'TRUE']
-    if cancellation_policy != 'All':
-        filtered_df = filtered_df[filtered_df['cancellation_policy'] == cancellation_policy]
-    filtered_df = filtered_df[filtered_df['minimum nights'] >= min_nights]
-    filtered_df = filtered_df[filtered_df['price'] <= max_price]
+    chart_filters = page_filters + (exploring,)
 
     # Display total count of people who visited
-    total_people = filtered_df['id'].nunique()
     st.subheader("Total People Visited")
-    st.write(f"Total Visitors: {total_people}")
+    show_total("Total Visitors", totals['total_visitors'])
 
     # Display total host listings count
-    total_host_listings = filtered_df['calculated host listings count'].sum()
     st.subheader("Total Host Listings Count")
-    st.write(f"Total Host Listings: {total_host_listings}")
+    show_total("Total Host Listings", totals['total_host_listings'])
 
     # Price Distribution
     st.subheader("Price Distribution")
-    fig, ax = plt.subplots(figsize=(6, 3))  # Smaller graph size
-    sns.histplot(filtered_df['price'], bins=30, kde=True, color='green', ax=ax)
-    ax.set_xlabel("Price ($)")
-    ax.set_ylabel("Number of Listings")
-    st.pyplot(fig)
+    def chart_price_hist():
+        return histogram_chart(insights_histogram('price'), 30, 'green', (6, 3),
+                               xlabel="Price ($)", ylabel="Number of Listings")
+    show_chart('insights.price_hist', chart_price_hist, chart_filters)
 
     # Availability Insights
     st.subheader("Availability Distribution")
-    fig, ax = plt.subplots(figsize=(6, 3))  # Smaller graph size
-    sns.histplot(filtered_df['availability 365'], bins=20, kde=True, color='blue', ax=ax)
-    ax.set_xlabel("Availability (Days per Year)")
-    ax.set_ylabel("Number of Listings")
-    st.pyplot(fig)
+    def chart_availability_hist():
+        return histogram_chart(insights_histogram('availability 365'), 20, 'blue', (6, 3),
+                               xlabel="Availability (Days per Year)", ylabel="Number of Listings")
+    show_chart('insights.availability_hist', chart_availability_hist, chart_filters)
 
     # Reviews Analysis
     st.subheader("Reviews Distribution")
-    fig, ax = plt.subplots(figsize=(6, 3))  # Smaller graph size
-    sns.histplot(filtered_df['number of reviews'], bins=20, kde=True, color='purple', ax=ax)
-    ax.set_xlabel("Number of Reviews")
-    ax.set_ylabel("Number of Listings")
-    st.pyplot(fig)
+    def chart_reviews_hist():
+        return histogram_chart(insights_histogram('number of reviews'), 20, 'purple', (6, 3),
+                               xlabel="Number of Reviews", ylabel="Number of Listings")
+    show_chart('insights.reviews_hist', chart_reviews_hist, chart_filters)
 
 elif menu == "Comparative Analysis":
     st.header("Comparative Analysis")
@@ -387,34 +481,30 @@ elif menu == "Comparative Analysis":
         st.markdown('<div class="chart-box">'
                     '<h3>Top Neighbourhood Groups by Average Price</h3>'
                     '</div>', unsafe_allow_html=True)
-        top_neighbourhood_price = df.groupby('neighbourhood group')['price'].mean().sort_values(ascending=False).head(5)
-        fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-        top_neighbourhood_price.plot(kind='bar', color='orange', ax=ax)
-        ax.set_ylabel("Average Price ($)")
-        ax.set_xlabel("Neighbourhood Group")
-        st.pyplot(fig)
+        def chart_top_groups_price():
+            top_neighbourhood_price = comparative(dataset, 'top_groups_by_price')
+            return series_chart(top_neighbourhood_price, 'bar', (4, 3), {'color': 'orange'},
+                                ylabel="Average Price ($)", xlabel="Neighbourhood Group")
+        show_chart('comparative.top_groups_price', chart_top_groups_price)
 
     with col2:
         st.markdown('<div class="chart-box">'
                     '<h3>Top Neighbourhood Groups by Total Reviews</h3>'
                     '</div>', unsafe_allow_html=True)
-        top_neighbourhood_reviews = df.groupby('neighbourhood group')['number of reviews'].sum().sort_values(
-            ascending=False).head(5)
-        fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-        top_neighbourhood_reviews.plot(kind='bar', color='purple', ax=ax)
-        ax.set_ylabel("Total Reviews")
-        ax.set_xlabel("Neighbourhood Group")
-        st.pyplot(fig)
+        def chart_top_groups_reviews():
+            top_neighbourhood_reviews = comparative(dataset, 'top_groups_by_reviews')
+            return series_chart(top_neighbourhood_reviews, 'bar', (4, 3), {'color': 'purple'},
+                                ylabel="Total Reviews", xlabel="Neighbourhood Group")
+        show_chart('comparative.top_groups_reviews', chart_top_groups_reviews)
 
     with col3:
         st.markdown('<div class="chart-box">'
                     '<h3>Top 5 Most Expensive Neighbourhoods</h3>'
                     '</div>', unsafe_allow_html=True)
-        top_expensive = df.groupby('neighbourhood')['price'].mean().sort_values(ascending=False).head(5)
-        fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-        top_expensive.plot(kind='bar', color='red', ax=ax)
-        ax.set_ylabel("Average Price ($)")
-        st.pyplot(fig)
+        def chart_top_neighbourhoods_price():
+            top_expensive = comparative(dataset, 'top_neighbourhoods_by_price')
+            return series_chart(top_expensive, 'bar', (4, 3), {'color': 'red'}, ylabel="Average Price ($)")
+        show_chart('comparative.top_neighbourhoods_price', chart_top_neighbourhoods_price)
 
     # Row 2: Three-column layout for Most Reviewed Neighbourhoods, Room Type Distribution, and Average Price by Room Type
     col1, col2, col3 = st.columns(3)
@@ -422,32 +512,29 @@ elif menu == "Comparative Analysis":
         st.markdown('<div class="chart-box">'
                     '<h3>Top 5 Most Reviewed Neighbourhoods</h3>'
                     '</div>', unsafe_allow_html=True)
-        top_reviewed = df.groupby('neighbourhood')['number of reviews'].sum().sort_values(ascending=False).head(5)
-        fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-        top_reviewed.plot(kind='bar', color='purple', ax=ax)
-        ax.set_ylabel("Total Reviews")
-        st.pyplot(fig)
+        def chart_top_neighbourhoods_reviews():
+            top_reviewed = comparative(dataset, 'top_neighbourhoods_by_reviews')
+            return series_chart(top_reviewed, 'bar', (4, 3), {'color': 'purple'}, ylabel="Total Reviews")
+        show_chart('comparative.top_neighbourhoods_reviews', chart_top_neighbourhoods_reviews)
 
     with col2:
         st.markdown('<div class="chart-box">'
                     '<h3>Room Type Distribution</h3>'
                     '</div>', unsafe_allow_html=True)
-        fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-        df['room type'].value_counts().plot(kind='pie', autopct='%1.1f%%', colors=['gold', 'lightcoral', 'lightblue'],
-                                            ax=ax)
-        ax.set_ylabel("")
-        st.pyplot(fig)
+        def chart_room_type_pie():
+            return series_chart(value_counts(dataset, 'room type'), 'pie', (4, 3),
+                                {'autopct': '%1.1f%%', 'colors': ['gold', 'lightcoral', 'lightblue']}, ylabel="")
+        show_chart('comparative.room_type_pie', chart_room_type_pie)
 
     with col3:
         st.markdown('<div class="chart-box">'
                     '<h3>Average Price by Room Type</h3>'
                     '</div>', unsafe_allow_html=True)
-        avg_price_by_room = df.groupby('room type')['price'].mean().dropna()
-        fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-        avg_price_by_room.sort_values().plot(kind='barh', color='orange', ax=ax)
-        ax.set_xlabel("Average Price ($)")
-        ax.set_ylabel("Room Type")
-        st.pyplot(fig)
+        def chart_avg_price_by_room():
+            avg_price_by_room = comparative(dataset, 'avg_price_by_room_type')
+            return series_chart(avg_price_by_room.sort_values(), 'barh', (4, 3), {'color': 'orange'},
+                                xlabel="Average Price ($)", ylabel="Room Type")
+        show_chart('comparative.avg_price_by_room', chart_avg_price_by_room)
 
     # Row 3: Three-column layout for Total Listings by Room Type, Average Availability by Room Type, and Instant Bookable Listings
     col1, col2, col3 = st.columns(3)
@@ -455,46 +542,73 @@ elif menu == "Comparative Analysis":
         st.markdown('<div class="chart-box">'
                     '<h3>Total Listings by Room Type</h3>'
                     '</div>', unsafe_allow_html=True)
-        fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-        df['room type'].value_counts().plot(kind='bar', color=['gold', 'lightcoral', 'lightblue'], ax=ax)
-        ax.set_ylabel("Number of Listings")
-        st.pyplot(fig)
+        def chart_listings_by_room():
+            return series_chart(value_counts(dataset, 'room type'), 'bar', (4, 3),
+                                {'color': ['gold', 'lightcoral', 'lightblue']}, ylabel="Number of Listings")
+        show_chart('comparative.listings_by_room', chart_listings_by_room)
 
     with col2:
         st.markdown('<div class="chart-box">'
                     '<h3>Average Availability by Room Type</h3>'
                     '</div>', unsafe_allow_html=True)
-        availability_by_room = df.groupby('room type')['availability 365'].mean()
-        fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-        availability_by_room.sort_values().plot(kind='bar', color=['gold', 'lightcoral', 'lightblue'], ax=ax)
-        ax.set_ylabel("Average Availability (Days per Year)")
-        ax.set_xlabel("Room Type")
-        st.pyplot(fig)
+        def chart_availability_by_room():
+            availability_by_room = comparative(dataset, 'avg_availability_by_room_type')
+            return series_chart(availability_by_room.sort_values(), 'bar', (4, 3),
+                                {'color': ['gold', 'lightcoral', 'lightblue']},
+                                ylabel="Average Availability (Days per Year)", xlabel="Room Type")
+        show_chart('comparative.availability_by_room', chart_availability_by_room)
 
     with col3:
         if 'instant_bookable' in df.columns:
             st.markdown('<div class="chart-box">'
                         '<h3>Instant Bookable Listings</h3>'
                         '</div>', unsafe_allow_html=True)
-            fig, ax = plt.subplots(figsize=(4, 3))  # Smaller graph size
-            df['instant_bookable'].value_counts().plot(kind='pie', autopct='%1.1f%%',
-                                                       labels=df['instant_bookable'].unique(),
-                                                       colors=['red', 'green'], ax=ax)
-            ax.set_ylabel("")
-            st.pyplot(fig)
+            def chart_instant_bookable_pie():
+                instant_counts = value_counts(dataset, 'instant_bookable', dropna=False).rename(
+                    index={True: 'TRUE', False: 'FALSE'})
+                return series_chart(instant_counts, 'pie', (4, 3),
+                                    {'autopct': '%1.1f%%', 'colors': ['red', 'green', 'grey']}, ylabel="")
+            show_chart('comparative.instant_bookable_pie', chart_instant_bookable_pie)
         else:
             st.write("Instant bookable data not available.")
 
+    # Row 4: Review trends over time, summed from the day/week/month rollups built at load time
+    st.markdown('<div class="chart-box">'
+                '<h3>Review Trends</h3>'
+                '</div>', unsafe_allow_html=True)
+    review_dates = dataset.trends.date_range()
+    if review_dates is None:
+        st.write("Review dates not available.")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
+        granularity = col1.selectbox("Granularity", FREQUENCIES, index=2, format_func=FREQUENCY_NAMES.get)
+        trend_measure = col2.selectbox("Measure", TREND_MEASURES, format_func=str.capitalize)
+        trend_by = col3.selectbox("Split by", TREND_DIMENSIONS, format_func=str.title)
+        smoothing = col4.number_input("Rolling window (buckets)", min_value=1, max_value=52, value=1)
+        first_review, last_review = (date.astype(object) for date in review_dates)
+        # Clamp the day so a latest review on Feb 29 starts on Feb 28
+        start_year = last_review.year - 5
+        five_years_back = last_review.replace(year=start_year, day=min(last_review.day, calendar.monthrange(
+            start_year, last_review.month)[1]))
+        date_range = st.slider("Last review between", min_value=first_review, max_value=last_review,
+                               value=(max(first_review, five_years_back), last_review))
+
+        def chart_review_trends():
+            trends = review_trends(dataset, granularity, trend_measure, trend_by,
+                                   start=date_range[0], end=date_range[1], window=smoothing)
+            ylabel = "Listings Last Reviewed" if trend_measure == 'listings' else "Average Reviews per Month"
+            return series_chart(trends, 'line', (12, 4), ylabel=ylabel, xlabel="Last Review")
+        show_chart('comparative.review_trends', chart_review_trends,
+                   (granularity, trend_measure, trend_by, smoothing, date_range))
+
 elif menu == "Recommendation":
     st.header("Find the Best Airbnb for You!")
 
     # Dropdown for Neighbourhood Group
-    selected_group = st.selectbox("Select Neighbourhood Group", sorted(df['neighbourhood group'].dropna().unique()))
+    selected_group = st.selectbox("Select Neighbourhood Group", catalog.values['neighbourhood group'])
 
     # Filter Neighbourhoods based on selected group
-    filtered_neighbourhoods = df[df['neighbourhood group'] == selected_group]['neighbourhood'].dropna().astype(
-        str).unique()
-    selected_neighbourhood = st.selectbox("Select Neighbourhood", sorted(filtered_neighbourhoods))
+    selected_neighbourhood = st.selectbox("Select Neighbourhood", catalog.neighbourhoods.get(selected_group, []))
 
     # Price input
     total_budget = st.number_input("Enter Your Total Budget ($)", min_value=0, value=100)
@@ -503,29 +617,49 @@ elif menu == "Recommendation":
     num_nights = st.number_input("Enter Number of Nights", min_value=1, value=1)
 
     # Room Type selection (Added 'Any' option)
-    room_types = ['Any'] + sorted(df['room type'].dropna().unique().tolist())
+    room_types = ['Any'] + catalog.options('room type', [('neighbourhood group', selected_group),
+                                                         ('neighbourhood', selected_neighbourhood)])
     selected_room_type = st.selectbox("Select Room Type", room_types)
 
-    # Filter based on user selection
-    filtered_df = df[(df['neighbourhood group'] == selected_group) &
-                     (df['neighbourhood'] == selected_neighbourhood)]
-
-    # Apply Room Type filter only if a specific type is selected
-    if selected_room_type != 'Any':
-        filtered_df = filtered_df[filtered_df['room type'] == selected_room_type]
-
-    # Allow flexibility in budget (+/- 15%)
-    price_lower = total_budget * 0.85
-    price_upper = total_budget * 1.15
-    filtered_df = filtered_df[(filtered_df['price'] + (filtered_df['service fee'] * num_nights) >= price_lower) &
-                              (filtered_df['price'] + (filtered_df['service fee'] * num_nights) <= price_upper)]
-
-    # Allow flexibility in nights (+/- 2 nights)
-    filtered_df = filtered_df[(filtered_df['minimum nights'] >= max(1, num_nights - 2)) &
-                              (filtered_df['minimum nights'] <= num_nights + 2)]
-
-    # if not filtered_df.empty:
-    #     st.subheader("Available Locations")
-    #     st.write(filtered_df[['NAME', 'price', 'service fee', 'room type', 'availability 365']])
-    # else:
-    #     st.write("No available listings match your criteria.")
\ No newline at end of file
+    # Rank matching listings; the ±15% budget / ±2 nights window widens when too few listings match
+    filtered_df = recommendations(dataset, selected_group, selected_neighbourhood, total_budget, num_nights,
+                                  selected_room_type)
+
+    if not filtered_df.empty:
+        st.subheader("Available Locations")
+        if filtered_df.attrs['widening']:
+            tolerance, nights_window, area = WIDENING[filtered_df.attrs['widening']]
+            st.info(f"Few exact matches, so the search was widened to ±{tolerance:.0%} of your budget and "
+                    f"±{nights_window} nights across the {area}.")
+        st.dataframe(filtered_df, hide_index=True)
+    else:
+        st.write("No available listings match your criteria.")
+
+draw_pending_charts()
+diagnostics.stop()
+traces = st.session_state.setdefault('diagnostics_traces', [])
+traces.append(trace)
+del traces[:-diagnostics.MAX_TRACES]
+
+if st.query_params.get('diagnostics') == '1' or os.environ.get('DASHBOARD_DIAGNOSTICS') == '1':
+    with st.sidebar.expander("Diagnostics"):
+        st.write(f"Last rerun ({trace.label}): {trace.duration * 1000:.1f} ms")
+        st.dataframe(trace.summary(), hide_index=True)
+        st.write(chart_cache.stats())
+        st.download_button("Export trace (Chrome JSON)", diagnostics.chrome_trace(traces),
+                           file_name='dashboard_trace.json', mime='application/json')
+
+# Approximate answers were shown: a fragment on a timer reruns the whole page with exact results
+# APPROXIMATE_IDLE_SECONDS after this run, unless a widget change reruns it first (approximate again,
+# re-arming the timer). Nothing blocks the script thread meanwhile.
+if exact_rerun_pending:
+    st.session_state['exact_rerun_armed'] = False
+
+    @st.fragment(run_every=float(os.environ.get('APPROXIMATE_IDLE_SECONDS', 1.0)))
+    def rerun_exact_when_idle():
+        # The first call is part of this run; only a timed call means the filters stayed put
+        if st.session_state.get('exact_rerun_armed'):
+            st.rerun()
+        st.session_state['exact_rerun_armed'] = True
+
+    rerun_exact_when_idle()
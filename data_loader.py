@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import diagnostics
+from cleaning import arrow_safe, clean_data, parse_columns, within_nights_cutoff
+from ingest import DEFAULT_CHUNK_ROWS, stream_ingest
+from schema import CATEGORICAL_COLUMNS, DOWNCAST_COLUMNS, apply_schema, series_downcast_dtype
+
+DATA_FILE = "Airbnb_Open_Data.csv"
+SNAPSHOT_DIR = ".snapshot"
+SNAPSHOT_FILE = "listings.feather"
+MANIFEST_FILE = "manifest.json"
+
+# Headline numbers of the last loaded version, shown while a new server process is still loading
+SUMMARY_FILE = "summary.json"
+
+# Periodic delta exports (CSV, same columns as the main export) upserted by listing id
+DELTA_DIR = "deltas"
+
+# CSVs at least this large are ingested in chunks instead of with a single read_csv
+STREAMING_MIN_BYTES = 512 * 1024 * 1024
+
+# Bump whenever clean_data() changes so old snapshots are rebuilt
+SNAPSHOT_VERSION = 3
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, value):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+def _write_manifest(snapshot_dir, manifest):
+    _write_json(os.path.join(snapshot_dir, MANIFEST_FILE), manifest)
+
+
+# The persisted summary ({'version': ..., 'kpis': {...}}), or None if there is none yet
+def read_summary(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, SUMMARY_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_summary(summary, snapshot_dir=SNAPSHOT_DIR):
+    _write_json(os.path.join(snapshot_dir, SUMMARY_FILE), summary)
+
+
+# Returns the manifest describing the current snapshot, rebuilding it if the CSV changed.
+# mtime/size are checked first so an unchanged file is never re-hashed; a touched but
+# identical file only costs a hash, not a re-parse. `chunksize` forces streaming ingest with that many
+# rows per chunk; by default only files over STREAMING_MIN_BYTES are streamed.
+def ensure_snapshot(file_path=DATA_FILE, snapshot_dir=SNAPSHOT_DIR, chunksize=None):
+    stat = os.stat(file_path)
+    source = {'path': os.path.abspath(file_path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+    snapshot_path = os.path.join(snapshot_dir, SNAPSHOT_FILE)
+    manifest = _read_manifest(snapshot_dir)
+
+    if (manifest is not None and manifest.get('version') == SNAPSHOT_VERSION
+            and manifest.get('path') == source['path'] and os.path.exists(snapshot_path)):
+        if manifest['mtime'] == source['mtime'] and manifest['size'] == source['size']:
+            return manifest
+        source['sha256'] = _file_hash(file_path)
+        if manifest['sha256'] == source['sha256']:
+            manifest.update(source)
+            _write_manifest(snapshot_dir, manifest)
+            return manifest
+    else:
+        source['sha256'] = _file_hash(file_path)
+
+    if chunksize is None and stat.st_size >= STREAMING_MIN_BYTES:
+        chunksize = DEFAULT_CHUNK_ROWS
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tmp_path = snapshot_path + '.tmp'
+    # Uncompressed so the snapshot can be memory-mapped instead of decoded
+    if chunksize:
+        with diagnostics.span('stream_ingest', 'load') as span:
+            report = stream_ingest(file_path, tmp_path, chunksize)
+            span.rows_out = report['rows']
+    else:
+        with diagnostics.span('read_csv', 'load') as span:
+            df = pd.read_csv(file_path)
+            span.rows_out = len(df)
+        with diagnostics.span('clean_data', 'load', len(df)) as span:
+            df = arrow_safe(clean_data(df))
+            span.rows_out = len(df)
+        with diagnostics.span('apply_schema', 'load', len(df)):
+            df, report = apply_schema(df)
+        with diagnostics.span('write_snapshot', 'load', len(df)):
+            feather.write_feather(df, tmp_path, compression='uncompressed')
+        report['rows'] = len(df)
+        report['nights_cutoff'] = df.attrs['nights_cutoff']
+    os.replace(tmp_path, snapshot_path)
+
+    manifest = dict(source, version=SNAPSHOT_VERSION, streamed=bool(chunksize), **report)
+    _write_manifest(snapshot_dir, manifest)
+    return manifest
+
+
+def _write_snapshot(df, snapshot_dir):
+    snapshot_path = os.path.join(snapshot_dir, SNAPSHOT_FILE)
+    tmp_path = snapshot_path + '.tmp'
+    feather.write_feather(df, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, snapshot_path)
+
+
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    table = feather.read_table(os.path.join(snapshot_dir, SNAPSHOT_FILE), memory_map=True)
+    # Dictionary columns come back as categoricals; keep nullable booleans nullable
+    return table.to_pandas(types_mapper={pa.bool_(): pd.BooleanDtype()}.get)
+
+
+# Identifies the cleaned data a snapshot holds; caches key derived results on it
+def dataset_version(manifest):
+    version = f"{manifest['version']}-{manifest['sha256'][:16]}"
+    deltas = manifest.get('deltas', [])
+    if deltas:
+        version += f"+{len(deltas)}-{deltas[-1]['sha256'][:8]}"
+    return version
+
+
+# Load cleaned dataset, parsing the CSV only when it changed since the last snapshot.
+# The dataset version is stored in df.attrs['version'].
+def load_data(file_path=DATA_FILE, snapshot_dir=SNAPSHOT_DIR, chunksize=None):
+    with diagnostics.span('load_data', 'load') as span:
+        manifest = ensure_snapshot(file_path, snapshot_dir, chunksize)
+        df = load_snapshot(snapshot_dir)
+        df.attrs['version'] = dataset_version(manifest)
+        span.rows_out = len(df)
+    return df
+
+
+# Delta exports in `delta_dir` not yet folded into the snapshot, oldest file name first
+def pending_deltas(manifest, delta_dir=DELTA_DIR):
+    if not os.path.isdir(delta_dir):
+        return []
+    applied = {(delta['path'], delta['mtime'], delta['size']) for delta in manifest.get('deltas', [])}
+    pending = []
+    for name in sorted(os.listdir(delta_dir)):
+        if not name.endswith('.csv'):
+            continue
+        path = os.path.abspath(os.path.join(delta_dir, name))
+        stat = os.stat(path)
+        if (path, stat.st_mtime, stat.st_size) not in applied:
+            pending.append(path)
+    return pending
+
+
+# Row-local cleaning of a delta export; within one export the last row for an id wins
+def read_delta(file_path):
+    delta = arrow_safe(parse_columns(pd.read_csv(file_path)))
+    return delta.drop_duplicates().drop_duplicates('id', keep='last')
+
+
+# Replace every row whose id appears in `delta` and append the delta rows that pass the existing
+# minimum-nights cutoff. Returns (new_df, keep): new_df holds the old rows where `keep` is True, in
+# order, followed by the new rows, which is the layout the incremental index updates expect.
+def upsert(df, delta, nights_cutoff):
+    keep = ~df['id'].isin(delta['id']).to_numpy()
+    delta = delta[within_nights_cutoff(delta, nights_cutoff)].reindex(columns=df.columns)
+
+    # Widen the schema just enough for both old and new rows; new categories are appended so the
+    # existing codes stay valid
+    categories, dtypes = {}, {}
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            known = df[col].cat.categories
+            new_values = sorted(set(delta[col].dropna().astype(str)) - set(known))
+            categories[col] = list(known) + new_values
+    for col in DOWNCAST_COLUMNS:
+        if col in df.columns:
+            dtypes[col] = np.promote_types(df[col].dtype, series_downcast_dtype(delta[col]))
+    delta, _ = apply_schema(delta, categories, dtypes)
+
+    widened = dict(dtypes, **{col: pd.CategoricalDtype(values) for col, values in categories.items()})
+    new_df = pd.concat([df[keep].astype(widened), delta], ignore_index=True)
+    return new_df, keep
+
+
+# Fold one delta export into the loaded dataset and the on-disk snapshot without re-cleaning the
+# main CSV. Returns (new_df, keep) as upsert() does, with the new version in new_df.attrs.
+def apply_delta(df, delta_path, snapshot_dir=SNAPSHOT_DIR):
+    manifest = _read_manifest(snapshot_dir)
+    delta = read_delta(delta_path)
+    new_df, keep = upsert(df, delta, manifest['nights_cutoff'])
+    _write_snapshot(new_df, snapshot_dir)
+
+    stat = os.stat(delta_path)
+    manifest.setdefault('deltas', []).append({'path': os.path.abspath(delta_path), 'mtime': stat.st_mtime,
+                                              'size': stat.st_size, 'sha256': _file_hash(delta_path),
+                                              'rows': len(delta)})
+    manifest['rows'] = len(new_df)
+    _write_manifest(snapshot_dir, manifest)
+    new_df.attrs['version'] = dataset_version(manifest)
+    return new_df, keep
@@ -0,0 +1,89 @@
+import threading
+
+import diagnostics
+from aggregates import AggregateCube
+from approximate import StratifiedSample
+from catalog import Catalog
+from data_loader import DATA_FILE, DELTA_DIR, SNAPSHOT_DIR, apply_delta, ensure_snapshot, load_data, pending_deltas
+from engines import create_engine, engine_class
+from filters import FilterIndex
+from histograms import HistogramStore
+from recommender import Recommender
+from spatial import SpatialIndex
+from timeseries import ReviewTrends
+
+
+# One dataset version together with every index and summary derived from it. Treat as read-only:
+# all sessions share it.
+class Dataset:
+    def __init__(self, df, filter_index=None, cube=None, histograms=None):
+        self.df = df
+        self.version = df.attrs.get('version')
+        # Backend for the pushed-down page filters and groupbys, chosen by QUERY_ENGINE. The posting-list
+        # index and aggregate cube are only built for an engine that runs on them (None otherwise); the
+        # structures below are built from `df` with every engine, so the frame must fit in memory regardless.
+        indexed = engine_class().uses_indexes
+        if filter_index is None and indexed:
+            with diagnostics.span('build FilterIndex', 'index', len(df)):
+                filter_index = FilterIndex(df)
+        if cube is None and indexed:
+            with diagnostics.span('build AggregateCube', 'index', len(df)):
+                cube = AggregateCube(df)
+        if histograms is None:
+            with diagnostics.span('build HistogramStore', 'index', len(df)):
+                histograms = HistogramStore(df, cube)
+        self.filter_index = filter_index
+        self.cube = cube
+        self.histograms = histograms
+        with diagnostics.span('build query engine', 'index', len(df)):
+            self.engine = create_engine(df, filter_index, cube)
+        # These are a handful of vector ops (and one sort) over the frame, so rebuilt rather than updated on upsert
+        with diagnostics.span('build Recommender', 'index', len(df)):
+            self.recommender = Recommender(df, self.engine)
+        with diagnostics.span('build SpatialIndex', 'index', len(df)):
+            self.spatial = SpatialIndex(df)
+        with diagnostics.span('build Catalog', 'index', len(df)):
+            self.catalog = Catalog(df, self.engine)
+        with diagnostics.span('build ReviewTrends', 'index', len(df)):
+            self.trends = ReviewTrends(df)
+        with diagnostics.span('build StratifiedSample', 'index', len(df)):
+            self.sample = StratifiedSample(df, histograms)
+
+    # Dataset for an upserted frame, updating each derived structure from the delta alone. Without the
+    # in-memory indexes there is nothing to update: the engine exports the new version and the rest is rebuilt.
+    def upsert(self, new_df, keep):
+        if self.cube is None:
+            return Dataset(new_df)
+        cube = self.cube.apply_delta(self.df, new_df, keep)
+        return Dataset(new_df, self.filter_index.apply_delta(new_df, keep), cube,
+                       self.histograms.apply_delta(new_df, keep, cube))
+
+
+# The process-wide current Dataset. refresh() folds newly arrived delta exports in incrementally and
+# swaps the result in, so a session mid-rerun keeps the version it started with. A changed main CSV
+# still triggers a full reload.
+class LiveDataset:
+    def __init__(self, file_path=DATA_FILE, snapshot_dir=SNAPSHOT_DIR, delta_dir=DELTA_DIR):
+        self.file_path = file_path
+        self.snapshot_dir = snapshot_dir
+        self.delta_dir = delta_dir
+        self._lock = threading.Lock()
+        self.current = self._load()
+
+    def _load(self):
+        df = load_data(self.file_path, self.snapshot_dir)
+        self._base_sha = ensure_snapshot(self.file_path, self.snapshot_dir)['sha256']
+        return Dataset(df)
+
+    def refresh(self):
+        with self._lock:
+            # Only stats the CSV and lists the delta directory when nothing changed
+            manifest = ensure_snapshot(self.file_path, self.snapshot_dir)
+            current = self.current if manifest['sha256'] == self._base_sha else self._load()
+            for path in pending_deltas(manifest, self.delta_dir):
+                with diagnostics.span('apply_delta', 'load', len(current.df)) as span:
+                    new_df, keep = apply_delta(current.df, path, self.snapshot_dir)
+                    current = current.upsert(new_df, keep)
+                    span.rows_out = len(new_df)
+            self.current = current
+            return current
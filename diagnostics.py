@@ -0,0 +1,184 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Reruns kept per session for the Diagnostics panel and the trace export
+MAX_TRACES = 20
+
+_local = threading.local()
+
+
+def _page_size():
+    try:
+        return os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return 4096
+
+
+_PAGE_SIZE = _page_size()
+
+
+# Resident set size from /proc (Linux); 0 where unavailable, so byte counts read as unknown
+def _rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+# Memory gauge used for a span's byte count: Python allocations when tracemalloc is running
+# (DIAGNOSTICS_TRACEMALLOC=1), otherwise RSS growth, which is near free to read
+def _memory():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return _rss()
+
+
+if os.environ.get('DIAGNOSTICS_TRACEMALLOC') == '1' and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+def row_count(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(value)
+    return None
+
+
+class Span:
+    __slots__ = ('name', 'category', 'start', 'duration', 'rows_in', 'rows_out', 'bytes', 'thread')
+
+    def __init__(self, name, category, rows_in=None):
+        self.name = name
+        self.category = category
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes = None
+        self.start = self.duration = 0.0
+        self.thread = threading.get_ident()
+
+    def as_dict(self):
+        return {'name': self.name, 'category': self.category, 'ms': round(self.duration * 1000, 3),
+                'rows_in': self.rows_in, 'rows_out': self.rows_out, 'bytes': self.bytes}
+
+
+# Spans recorded during one script rerun, in start order
+class Trace:
+    def __init__(self, label=None):
+        self.label = label
+        self.spans = []
+        self.start = time.perf_counter()
+        self.duration = None
+
+    @contextmanager
+    def span(self, name, category='stage', rows_in=None):
+        span = Span(name, category, rows_in)
+        self.spans.append(span)
+        memory = _memory()
+        span.start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            # Callers may report a more meaningful byte count themselves (e.g. encoded PNG size)
+            if memory and span.bytes is None:
+                span.bytes = _memory() - memory
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def summary(self):
+        summary = pd.DataFrame([span.as_dict() for span in self.spans],
+                               columns=['name', 'category', 'ms', 'rows_in', 'rows_out', 'bytes'])
+        return summary.astype({'rows_in': 'Int64', 'rows_out': 'Int64', 'bytes': 'Int64'})
+
+
+# Stand-in yielded when nothing is being traced, so callers can always set rows_out
+class _NullSpan:
+    __slots__ = ('rows_in', 'rows_out', 'bytes')
+
+    def __init__(self):
+        self.rows_in = self.rows_out = self.bytes = None
+
+
+# Start tracing on this thread (one Streamlit session rerun) and return the trace
+def start(label=None):
+    _local.trace = Trace(label)
+    return _local.trace
+
+
+def stop():
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    if trace is not None:
+        trace.finish()
+    return trace
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+# Time a block under the current trace; a no-op when this thread is not tracing
+@contextmanager
+def span(name, category='stage', rows_in=None):
+    trace = current()
+    if trace is None:
+        yield _NullSpan()
+        return
+    with trace.span(name, category, rows_in) as recorded:
+        yield recorded
+
+
+# Add work timed elsewhere, e.g. in a worker process, to the current trace
+def record(name, category, start, duration, rows_in=None, rows_out=None, size=None):
+    trace = current()
+    if trace is None:
+        return
+    recorded = Span(name, category, rows_in)
+    recorded.start, recorded.duration = start, duration
+    recorded.rows_out, recorded.bytes = rows_out, size
+    trace.spans.append(recorded)
+
+
+# Decorator form of span() for query functions taking the Dataset first: rows in is the size of the
+# row selection passed second, else of the dataset; rows out the length of the returned rows/frame/series
+def traced(category):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current() is None:
+                return func(*args, **kwargs)
+            if len(args) > 1 and isinstance(args[1], np.ndarray):
+                rows_in = len(args[1])
+            else:
+                rows_in = row_count(getattr(args[0], 'df', None)) if args else None
+            with span(func.__name__, category, rows_in) as recorded:
+                result = func(*args, **kwargs)
+                recorded.rows_out = row_count(result)
+            return result
+        return wrapper
+    return decorate
+
+
+# Chrome trace event format (chrome://tracing, Perfetto): one complete event per span
+def chrome_trace(traces):
+    pid = os.getpid()
+    events = []
+    for trace in traces:
+        if trace.duration is not None:
+            events.append({'name': f"rerun: {trace.label}", 'cat': 'rerun', 'ph': 'X', 'pid': pid,
+                           'tid': trace.spans[0].thread if trace.spans else 0,
+                           'ts': trace.start * 1e6, 'dur': trace.duration * 1e6})
+        for span in trace.spans:
+            events.append({'name': span.name, 'cat': span.category, 'ph': 'X', 'pid': pid, 'tid': span.thread,
+                           'ts': span.start * 1e6, 'dur': span.duration * 1e6,
+                           'args': {'rows_in': span.rows_in, 'rows_out': span.rows_out, 'bytes': span.bytes}})
+    return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
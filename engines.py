@@ -0,0 +1,159 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_loader import SNAPSHOT_DIR
+from filters import ALL
+
+# Backend used by Dataset unless QUERY_ENGINE says otherwise: 'pandas' or 'duckdb'
+DEFAULT_ENGINE = 'pandas'
+
+# Parquet copies of each dataset version for the DuckDB backend; the newest KEEP_VERSIONS are kept so
+# sessions still on the previous version keep working across a refresh
+PARQUET_DIR = os.path.join(SNAPSHOT_DIR, 'parquet')
+KEEP_VERSIONS = 2
+
+# Row position of each listing in the loaded frame, stored alongside the Parquet columns
+ROW_COLUMN = '_row'
+
+_SQL_STATS = {'rows': 'count(*)', 'count': 'count({})', 'sum': 'coalesce(sum({}), 0)', 'mean': 'avg({})',
+              'std': 'stddev_samp({})', 'min': 'min({})', 'max': 'max({})'}
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _param(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+# Name of a frame's Parquet copy: its dataset version, or a hash of its contents for frames built without
+# load_data (so an edited frame never reuses an older export)
+def _export_name(df):
+    version = df.attrs.get('version')
+    if version:
+        return version
+    digest = hashlib.sha256('\0'.join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return 'content-' + digest.hexdigest()[:16]
+
+
+# Today's in-memory execution: posting-list filters and the aggregate cube
+class PandasEngine:
+    name = 'pandas'
+    # Dataset builds the FilterIndex and AggregateCube only for engines that run on them
+    uses_indexes = True
+
+    def __init__(self, df, filter_index, cube):
+        self.filter_index = filter_index
+        self.cube = cube
+
+    # Sorted row positions matching every (column, value) in `equals` ('All' ignored) and every inclusive
+    # (column, low, high) in `ranges` (None leaves a side open); FilterIndex.select's contract
+    def select(self, equals=(), ranges=()):
+        return self.filter_index.select(equals=equals, ranges=ranges)
+
+    # df.groupby(by)[measure].<stat>() without missing groups, or df[measure].<stat>() when by is None;
+    # stat is one of aggregates.STATS
+    def group_stat(self, by, measure, stat):
+        return self.cube.rollup(by, measure, stat)
+
+    # df[by].value_counts(dropna=dropna)
+    def value_counts(self, by, dropna=True):
+        return self.cube.value_counts(by, dropna=dropna)
+
+
+# Pushes the same queries down to DuckDB over a Parquet copy of the dataset version: vectorized,
+# multi-threaded and able to spill to disk, so filters and groupbys never scan the pandas frame.
+# The frame itself is still loaded (Dataset builds its other structures from it), so this saves
+# the index and cube memory, not the frame's. Results match PandasEngine (see tests/test_engines.py).
+class DuckDBEngine:
+    name = 'duckdb'
+    uses_indexes = False
+
+    def __init__(self, df, filter_index=None, cube=None, parquet_dir=None):
+        import duckdb
+
+        self.path = self._export(df, parquet_dir or PARQUET_DIR)
+        self._connection = duckdb.connect()
+        self._connection.execute(f"CREATE VIEW listings AS SELECT * FROM read_parquet('{self.path}')")
+
+    @staticmethod
+    def _export(df, parquet_dir):
+        os.makedirs(parquet_dir, exist_ok=True)
+        path = os.path.abspath(os.path.join(parquet_dir, f'listings-{_export_name(df)}.parquet'))
+        if not os.path.exists(path):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.append_column(ROW_COLUMN, pa.array(np.arange(len(df), dtype=np.int32)))
+            pq.write_table(table, path + '.tmp')
+            os.replace(path + '.tmp', path)
+        exports = sorted(glob.glob(os.path.join(parquet_dir, 'listings-*.parquet')), key=os.path.getmtime)
+        for old in exports[:-KEEP_VERSIONS]:
+            if old != path:
+                os.remove(old)
+        return path
+
+    # A cursor per call: the connection itself is not safe to share between threads
+    def _query(self, sql, params=()):
+        return self._connection.cursor().execute(sql, [_param(value) for value in params])
+
+    def select(self, equals=(), ranges=()):
+        clauses, params = [], []
+        for col, value in equals:
+            if isinstance(value, str) and value == ALL:
+                continue
+            clauses.append(f"{_quote(col)} = ?")
+            params.append(value)
+        for col, low, high in ranges:
+            if low is not None:
+                clauses.append(f"{_quote(col)} >= ?")
+                params.append(low)
+            if high is not None:
+                clauses.append(f"{_quote(col)} <= ?")
+                params.append(high)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._query(f"SELECT {ROW_COLUMN} FROM listings {where} ORDER BY {ROW_COLUMN}", params)
+        return rows.fetchnumpy()[ROW_COLUMN].astype(np.int32)
+
+    def group_stat(self, by, measure, stat):
+        if stat not in _SQL_STATS:
+            raise ValueError(f"Unknown statistic {stat!r}; expected one of {list(_SQL_STATS)}")
+        value = _SQL_STATS[stat].format(_quote(measure) if measure else '')
+        if by is None:
+            return self._query(f"SELECT {value} FROM listings").fetchone()[0]
+        key = _quote(by)
+        result = self._query(f"SELECT {key} AS key, {value} AS value FROM listings WHERE {key} IS NOT NULL "
+                             f"GROUP BY 1 ORDER BY 1").df()
+        return pd.Series(result['value'].to_numpy(), index=pd.Index(result['key'], name=by),
+                         name=measure if stat != 'rows' else 'count')
+
+    def value_counts(self, by, dropna=True):
+        key = _quote(by)
+        where = f"WHERE {key} IS NOT NULL" if dropna else ''
+        result = self._query(f"SELECT {key} AS key, count(*) AS count FROM listings {where} "
+                             f"GROUP BY 1 ORDER BY 2 DESC, 1 NULLS LAST").df()
+        return pd.Series(result['count'].to_numpy(), index=pd.Index(result['key'], name=by), name='count')
+
+
+ENGINES = {engine.name: engine for engine in (PandasEngine, DuckDBEngine)}
+
+
+# The configured engine class: `name`, else QUERY_ENGINE, else DEFAULT_ENGINE
+def engine_class(name=None):
+    name = name or os.environ.get('QUERY_ENGINE', DEFAULT_ENGINE)
+    if name not in ENGINES:
+        raise ValueError(f"Unknown query engine {name!r}; expected one of {sorted(ENGINES)}")
+    return ENGINES[name]
+
+
+# The configured engine for one dataset version; filter_index and cube may be None for engines that
+# do not use them
+def create_engine(df, filter_index, cube, name=None):
+    return engine_class(name)(df, filter_index, cube)
+
@@ -0,0 +1,156 @@
+import numpy as np
+
+# Selector value meaning "don't filter on this column"
+ALL = 'All'
+
+# Sidebar dimensions that get an inverted index at load time
+INDEXED_COLUMNS = ['country', 'neighbourhood group', 'neighbourhood', 'room type', 'cancellation_policy',
+                   'instant_bookable']
+
+# Numeric columns with a sorted index for range sliders and budget bands
+RANGE_COLUMNS = ['price', 'service fee', 'minimum nights']
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+# Materialize only the requested columns for the selected rows; the shared frame is never copied
+def take(df, rows, columns):
+    return df.iloc[rows, [df.columns.get_loc(col) for col in columns]]
+
+
+# Sorted positions of the values of `small` that also occur in `large` (both sorted, unique).
+# Binary search keeps the cost proportional to the smaller list.
+def intersect_sorted(small, large):
+    if len(small) > len(large):
+        small, large = large, small
+    if len(small) == 0:
+        return _EMPTY
+    pos = np.searchsorted(large, small)
+    pos[pos == len(large)] = 0
+    return small[large[pos] == small]
+
+
+def _postings(series):
+    # Group row positions by value in one stable sort; each slice is already ascending
+    if series.dtype == 'category':
+        values, codes = series.cat.categories, series.cat.codes.to_numpy()
+    else:
+        codes, values = series.factorize(use_na_sentinel=True)
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    counts = np.bincount(codes[codes >= 0], minlength=len(values))
+    offsets = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+    return {value: order[offsets[i]:offsets[i + 1]] for i, value in enumerate(values)}
+
+
+# Sorted copy of one numeric column so a [low, high] range is two binary searches.
+# NaN sorts last and never matches a range.
+class SortedIndex:
+    def __init__(self, series):
+        self.values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        self.order = np.argsort(self.values, kind='stable').astype(np.int32)
+        self.sorted_values = self.values[self.order]
+        self.n_valid = int(np.count_nonzero(~np.isnan(self.values)))
+
+    # Slice bounds into `order` for the inclusive range; None leaves a side open
+    def span(self, low=None, high=None):
+        start = 0 if low is None else int(np.searchsorted(self.sorted_values, low, side='left'))
+        stop = self.n_valid if high is None else int(np.searchsorted(self.sorted_values, high, side='right'))
+        return start, max(start, stop)
+
+    def rows(self, low=None, high=None):
+        start, stop = self.span(low, high)
+        return np.sort(self.order[start:stop])
+
+    # Index for the upserted frame: surviving entries are renumbered (which keeps them sorted) and the
+    # added rows are merged in by binary search instead of re-sorting the whole column
+    def apply_delta(self, series, keep, remap):
+        n_kept = int(np.count_nonzero(keep))
+        index = SortedIndex.__new__(SortedIndex)
+        index.values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+        survivors = self.order[keep[self.order]]
+        kept_order, kept_values = remap[survivors], self.values[survivors]
+        added_values = index.values[n_kept:]
+        added_order = np.argsort(added_values, kind='stable')
+        slots = np.searchsorted(kept_values, added_values[added_order], side='right')
+
+        index.order = np.insert(kept_order, slots, added_order + n_kept).astype(np.int32)
+        index.sorted_values = index.values[index.order]
+        index.n_valid = int(np.count_nonzero(~np.isnan(index.values)))
+        return index
+
+    def contains(self, rows, low=None, high=None):
+        values = self.values[rows]
+        keep = ~np.isnan(values)
+        if low is not None:
+            keep &= values >= low
+        if high is not None:
+            keep &= values <= high
+        return keep
+
+
+# Inverted index over the categorical filter columns: value -> sorted int32 row positions.
+# Multi-filter queries intersect the posting lists instead of scanning every row.
+class FilterIndex:
+    def __init__(self, df, columns=INDEXED_COLUMNS, range_columns=RANGE_COLUMNS):
+        self.df = df
+        self.n_rows = len(df)
+        self.postings = {col: _postings(df[col]) for col in columns if col in df.columns}
+        self.sorted = {col: SortedIndex(df[col]) for col in range_columns if col in df.columns}
+
+    def rows(self, column, value):
+        return self.postings[column].get(value, _EMPTY)
+
+    # Index for `df` = old rows where `keep` is True followed by the upserted rows (see
+    # data_loader.upsert). Only the added rows are grouped; existing posting lists are renumbered.
+    def apply_delta(self, df, keep):
+        n_kept = int(np.count_nonzero(keep))
+        remap = (np.cumsum(keep) - 1).astype(np.int32)
+
+        index = FilterIndex.__new__(FilterIndex)
+        index.df = df
+        index.n_rows = len(df)
+        index.postings = {}
+        for col, lists in self.postings.items():
+            added = _postings(df[col].iloc[n_kept:])
+            merged = {}
+            for value in set(lists) | set(added):
+                old = lists.get(value, _EMPTY)
+                merged[value] = np.concatenate([remap[old[keep[old]]],
+                                                 added.get(value, _EMPTY) + n_kept]).astype(np.int32)
+            index.postings[col] = merged
+        index.sorted = {col: sorted_index.apply_delta(df[col], keep, remap)
+                        for col, sorted_index in self.sorted.items()}
+        return index
+
+    # Sorted row positions matching every (column, value) in `equals` ('All' ignored) and every inclusive
+    # (column, low, high) range on RANGE_COLUMNS (None leaves a side open). Indexed columns are
+    # intersected smallest-first, anything else is evaluated only on the surviving candidates.
+    def select(self, equals=(), ranges=()):
+        active = [(col, value) for col, value in equals if not (isinstance(value, str) and value == ALL)]
+        lists = sorted((self.rows(col, value) for col, value in active if col in self.postings), key=len)
+        rows = None
+        for other in lists:
+            rows = other if rows is None else intersect_sorted(rows, other)
+
+        # Narrowest range first; a range is only expanded into row ids when it is smaller than the
+        # current candidate set, otherwise the candidates' values are checked directly
+        spans = []
+        for col, low, high in ranges:
+            start, stop = self.sorted[col].span(low, high)
+            spans.append((stop - start, self.sorted[col], low, high))
+        for size, index, low, high in sorted(spans, key=lambda span: span[0]):
+            if rows is None:
+                rows = index.rows(low, high)
+            elif size < len(rows):
+                rows = intersect_sorted(rows, index.rows(low, high))
+            else:
+                rows = rows[index.contains(rows, low, high)]
+        if rows is None:
+            rows = np.arange(self.n_rows, dtype=np.int32)
+
+        for col, value in active:
+            if col not in self.postings and len(rows):
+                values = self.df[col].iloc[rows]
+                rows = rows[(values == value).to_numpy(dtype=bool, na_value=False)]
+        return rows
@@ -0,0 +1,215 @@
+import numpy as np
+
+import diagnostics
+from aggregates import cell_entries, select_cells
+from filters import ALL
+
+# Columns the pages draw histograms of
+HISTOGRAM_MEASURES = ['price', 'availability 365', 'number of reviews']
+
+# Fixed fine bins per measure over its full range; divisible by the 20 and 30 display bins the pages use
+FINE_BINS = 240
+
+# Row subsets whose values occupy fewer fine bins than this (under 4 per 30-bar display) are re-binned
+# over their own range
+REBIN_BELOW = FINE_BINS // 2
+
+
+# Fine-bin counts of one measure over some subset of rows
+class Histogram:
+    def __init__(self, counts, edges):
+        self.counts = counts
+        self.edges = edges
+        self.total = int(counts.sum())
+
+    # Occupied fine-bin range [start, stop), like a histogram drawn over the subset's own min..max
+    def _occupied(self):
+        nonzero = np.flatnonzero(self.counts)
+        if len(nonzero) == 0:
+            return 0, 0
+        return int(nonzero[0]), int(nonzero[-1]) + 1
+
+    # First occupied fine bin and the fine-bin bounds of at most `bins` display bars, or None when empty
+    def _bounds(self, bins):
+        start, stop = self._occupied()
+        if stop == start:
+            return None
+        return start, np.unique(np.linspace(start, stop, min(bins, stop - start) + 1).round().astype(int))
+
+    # Merge fine bins into at most `bins` display bars; returns (edges, counts)
+    def rebin(self, bins):
+        bounds = self._bounds(bins)
+        if bounds is None:
+            return self.edges[:1], np.zeros(0, dtype=self.counts.dtype)
+        start, bounds = bounds
+        return self.edges[bounds], np.add.reduceat(self.counts[start:bounds[-1]], bounds[:-1] - start)
+
+    # ± confidence margin of each rebin() bar; None for exact counts
+    def margins(self, bins):
+        return None
+
+    # Gaussian KDE (Scott's rule, as seaborn uses) evaluated on the fine bins by convolving the binned
+    # counts, scaled to "listings per display bin". Returns (x, y) over the occupied range.
+    def density(self, display_width):
+        start, stop = self._occupied()
+        if self.total < 2:
+            return np.empty(0), np.empty(0)
+        fine_width = self.edges[1] - self.edges[0]
+        centers = (self.edges[:-1] + self.edges[1:]) / 2
+        mean = np.dot(self.counts, centers) / self.total
+        std = np.sqrt(np.dot(self.counts, (centers - mean) ** 2) / (self.total - 1))
+        sigma = std * self.total ** (-1 / 5) / fine_width
+        if sigma <= 0:
+            return np.empty(0), np.empty(0)
+
+        # The kernel may be wider than the counts (few or widely spread listings), so convolve in 'full'
+        # mode and take the part aligned with the counts; 'same' would centre on the longer kernel
+        reach = int(np.ceil(4 * sigma))
+        offsets = np.arange(-reach, reach + 1)
+        kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+        smoothed = np.convolve(self.counts, kernel / kernel.sum(), mode='full')[reach:reach + len(self.counts)]
+        return centers[start:stop], smoothed[start:stop] * display_width / fine_width
+
+
+# FINE_BINS equal-width edges over the non-missing values' min..max
+def fine_edges(values):
+    valid = values[~np.isnan(values)]
+    low, high = (valid.min(), valid.max()) if len(valid) else (0.0, 1.0)
+    if high <= low:
+        high = low + 1.0
+    return np.linspace(low, high, FINE_BINS + 1)
+
+
+# Fine bin of each value. Values outside the edges (possible after incremental updates) land in the
+# first/last bin; FINE_BINS marks missing values so they can be dropped after counting
+def fine_bins(values, edges):
+    valid = ~np.isnan(values)
+    bins = np.full(len(values), FINE_BINS, dtype=np.uint16)
+    bins[valid] = np.clip(np.floor((values[valid] - edges[0]) / (edges[1] - edges[0])), 0, FINE_BINS - 1)
+    return bins
+
+
+def _values(series):
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _counts(bins):
+    return np.bincount(bins, minlength=FINE_BINS + 1)[:FINE_BINS].astype(np.int64)
+
+
+# Nonzero counts per (cell, fine bin) key (cell * FINE_BINS + bin), CSR-style: (offsets, bins, counts)
+# with cell c's at offsets[c]:offsets[c + 1]. Most cells only cover a few bins of each measure.
+def _pack(keys, counts, n_cells):
+    nonzero = counts != 0
+    keys, counts = keys[nonzero], counts[nonzero]
+    offsets = np.searchsorted(keys // FINE_BINS, np.arange(n_cells + 1))
+    return offsets, (keys % FINE_BINS).astype(np.uint16), counts.astype(np.int32)
+
+
+def _row_keys(row_cells, bins):
+    valid = bins < FINE_BINS
+    return row_cells[valid].astype(np.int64) * FINE_BINS + bins[valid]
+
+
+def _cell_counts(row_cells, bins, n_cells):
+    keys, counts = np.unique(_row_keys(row_cells, bins), return_counts=True)
+    return _pack(keys, counts, n_cells)
+
+
+# Per-cell fine-bin counts for each measure, built once per dataset version on the aggregate cube's
+# cells and stored sparsely. Histograms for pure dimension filters are merged from the cells; arbitrary
+# row subsets are binned from precomputed per-row bin ids with a single bincount. Without a cube (the
+# DuckDB engine) only the whole-frame counts are kept.
+#
+# The fine edges span each measure's full range, so a narrow subset (or a frame with a far outlier)
+# can fall in only a few fine bins; such subsets are re-binned from their own values over their own
+# min..max, as a histogram of the raw values would be.
+class HistogramStore:
+    def __init__(self, df, cube, measures=HISTOGRAM_MEASURES):
+        self.cube = cube
+        self.columns = {}
+        self.edges = {}
+        self.bin_ids = {}
+        self.totals = {}
+        self.cell_counts = {}
+        for col in measures:
+            if col not in df.columns:
+                continue
+            values = _values(df[col])
+            # The frame's own column (not a copy), for re-binning narrow subsets
+            self.columns[col] = df[col]
+            self.edges[col] = fine_edges(values)
+            self.bin_ids[col] = fine_bins(values, self.edges[col])
+            self.totals[col] = _counts(self.bin_ids[col])
+            if cube is not None:
+                self.cell_counts[col] = _cell_counts(cube.row_cells, self.bin_ids[col], len(cube.keys))
+
+    # New store for the upserted frame, keeping the existing bin edges. `cube` is the already-updated
+    # aggregate cube for `new_df`; only removed and added rows are counted.
+    def apply_delta(self, new_df, keep, cube):
+        n_kept = int(np.count_nonzero(keep))
+        n_cells = len(cube.keys)
+        added_cells = cube.row_cells[n_kept:]
+
+        store = HistogramStore.__new__(HistogramStore)
+        store.cube = cube
+        store.columns = {col: new_df[col] for col in self.columns}
+        store.edges = self.edges
+        store.bin_ids = {}
+        store.totals = {}
+        store.cell_counts = {}
+        for col, edges in self.edges.items():
+            added_bins = fine_bins(_values(new_df[col].iloc[n_kept:]), edges)
+            removed_bins = self.bin_ids[col][~keep]
+            store.bin_ids[col] = np.concatenate([self.bin_ids[col][keep], added_bins])
+            store.totals[col] = self.totals[col] - _counts(removed_bins) + _counts(added_bins)
+
+            offsets, bins, counts = self.cell_counts[col]
+            old_keys = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)) * FINE_BINS + bins
+            removed_keys = _row_keys(self.cube.row_cells[~keep], removed_bins)
+            added_keys = _row_keys(added_cells, added_bins)
+            keys, slots = np.unique(np.concatenate([old_keys, removed_keys, added_keys]), return_inverse=True)
+            changes = np.concatenate([counts, np.full(len(removed_keys), -1), np.ones(len(added_keys))])
+            store.cell_counts[col] = _pack(keys, np.bincount(slots, weights=changes).round().astype(np.int64), n_cells)
+        return store
+
+    # Histogram of `measure` for the given row positions, or for the cells matching `where`
+    def histogram(self, measure, where=None, rows=None):
+        if rows is not None:
+            hist = Histogram(np.bincount(self.bin_ids[measure][rows], minlength=FINE_BINS + 1)[:FINE_BINS],
+                             self.edges[measure])
+            start, stop = hist._occupied()
+            if stop - start >= REBIN_BELOW or hist.total == 0:
+                return hist
+            values = _values(self.columns[measure].iloc[rows])
+            edges = fine_edges(values)
+            return Histogram(_counts(fine_bins(values, edges)), edges)
+        if all(isinstance(value, str) and value == ALL for value in (where or {}).values()):
+            return Histogram(self.totals[measure], self.edges[measure])
+        if self.cube is None:
+            raise ValueError("Histograms for dimension filters need the aggregate cube; pass rows instead")
+        offsets, bins, counts = self.cell_counts[measure]
+        entries = cell_entries(offsets, select_cells(self.cube.keys, where))
+        merged = np.bincount(bins[entries], weights=counts[entries], minlength=FINE_BINS).astype(np.int64)
+        return Histogram(merged, self.edges[measure])
+
+
+# Draws bars plus KDE line the way sns.histplot(..., kde=True) does, from binned counts only; estimated
+# counts get error bars for their confidence intervals
+def plot_histogram(ax, hist, bins, color):
+    import matplotlib as mpl
+    from matplotlib.colors import to_rgba
+
+    edges, counts = hist.rebin(bins)
+    if len(counts):
+        ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', facecolor=to_rgba(color, .5),
+               edgecolor=mpl.rcParams['patch.edgecolor'], linewidth=.5)
+        margins = hist.margins(bins)
+        if margins is not None:
+            ax.errorbar((edges[:-1] + edges[1:]) / 2, counts, yerr=margins, fmt='none', ecolor='black',
+                        elinewidth=.5, capsize=1.5)
+        with diagnostics.span('kde', 'chart', hist.total):
+            x, y = hist.density((edges[-1] - edges[0]) / len(counts))
+        ax.plot(x, y, color=color)
+    ax.set_ylabel("Count")
+    return ax
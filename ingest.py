@@ -0,0 +1,192 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cleaning import arrow_safe, parse_columns, within_nights_cutoff
+from schema import CATEGORICAL_COLUMNS, DOWNCAST_COLUMNS, apply_schema, downcast_dtype
+
+DEFAULT_CHUNK_ROWS = 200_000
+
+# Columns the dashboard reads, with the dtype each is parsed as; the rest of the export is skipped.
+# Explicit dtypes keep every chunk's schema identical and stop pandas from sniffing types per chunk.
+INGEST_DTYPES = {
+    'id': 'Int64',
+    'NAME': 'str',
+    'host id': 'Int64',
+    'neighbourhood group': 'str',
+    'neighbourhood': 'str',
+    'lat': 'float64',
+    'long': 'float64',
+    'country': 'str',
+    'instant_bookable': 'str',
+    'cancellation_policy': 'str',
+    'room type': 'str',
+    'price': 'str',
+    'service fee': 'str',
+    'minimum nights': 'float64',
+    'number of reviews': 'float64',
+    'last review': 'str',
+    'reviews per month': 'float64',
+    'review rate number': 'float64',
+    'calculated host listings count': 'float64',
+    'availability 365': 'float64',
+}
+
+
+# Streaming quantile estimate with bounded relative error (DDSketch-style log buckets).
+# Memory grows with the log of the value range, not with the number of rows.
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.005):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _add(self, store, magnitudes):
+        keys, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64),
+                                 return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.zeros += int(np.count_nonzero(values == 0))
+        self._add(self.positive, values[values > 0])
+        self._add(self.negative, -values[values < 0])
+
+    # Upper edge of the bucket holding the q-th value: never below the true quantile and at most
+    # `relative_accuracy` * 2 above it, so an "<= cutoff" filter keeps every row at the exact quantile
+    def quantile(self, q):
+        if self.count == 0:
+            return float('nan')
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self.gamma ** (key - 1)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self.gamma ** key
+        return self.gamma ** max(self.positive) if self.positive else 0.0
+
+
+# Exact-duplicate detection across chunks using 64-bit row digests, kept as a sorted uint64 array
+# (8 bytes per distinct row instead of the full row)
+class RowDigests:
+    def __init__(self):
+        self.seen = np.empty(0, dtype=np.uint64)
+
+    # Mask of rows not seen before, in this chunk or any earlier one
+    def first_occurrences(self, df):
+        digests = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        keep = np.zeros(len(df), dtype=bool)
+        keep[np.unique(digests, return_index=True)[1]] = True
+        keep &= ~np.isin(digests, self.seen)
+        self.seen = np.union1d(self.seen, digests[keep])
+        return keep
+
+
+# Dataset-wide facts the final schema needs before any chunk can be written
+class _SchemaStats:
+    def __init__(self):
+        self.categories = {col: set() for col in CATEGORICAL_COLUMNS}
+        self.numeric = {col: [math.inf, -math.inf, False, True] for col in DOWNCAST_COLUMNS}
+
+    def update(self, df):
+        for col, values in self.categories.items():
+            if col in df.columns:
+                values.update(df[col].dropna().unique().tolist())
+        for col, stats in self.numeric.items():
+            if col not in df.columns:
+                continue
+            values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = values[~np.isnan(values)]
+            if len(valid):
+                stats[0] = min(stats[0], valid.min())
+                stats[1] = max(stats[1], valid.max())
+                stats[3] = stats[3] and bool((valid % 1 == 0).all())
+            stats[2] = stats[2] or len(valid) < len(values)
+
+    def dtypes(self, nights_cutoff):
+        dtypes = {}
+        for col, (low, high, has_missing, integral) in self.numeric.items():
+            if col == 'minimum nights':
+                # Only rows inside [1, cutoff] survive the outlier filter
+                low, high = max(low, 1), min(high, nights_cutoff)
+            if low > high:
+                low = high = 0
+            dtypes[col] = downcast_dtype(low, high, has_missing, integral)
+        return dtypes
+
+
+# Clean a CSV in bounded chunks into an uncompressed Arrow/Feather file at `output_path`.
+# Pass 1 parses each chunk, drops rows already seen and feeds the minimum-nights sketch, staging the
+# result on disk. Pass 2 re-reads the memory-mapped staging file batch by batch, applies the outlier
+# cutoff and the compact schema, and writes the snapshot. Peak memory is a few chunks.
+def stream_ingest(file_path, output_path, chunksize=DEFAULT_CHUNK_ROWS, quantile=0.99, relative_accuracy=0.005):
+    staging_path = output_path + '.staging'
+    sketch = QuantileSketch(relative_accuracy)
+    digests = RowDigests()
+    stats = _SchemaStats()
+
+    writer = schema = None
+    reader = pd.read_csv(file_path, usecols=lambda col: col in INGEST_DTYPES, dtype=INGEST_DTYPES,
+                         chunksize=chunksize)
+    try:
+        for chunk in reader:
+            chunk = arrow_safe(parse_columns(chunk))
+            chunk = chunk[digests.first_occurrences(chunk)]
+            sketch.update(chunk['minimum nights'].to_numpy(dtype=np.float64, na_value=np.nan))
+            stats.update(chunk)
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False, schema=schema)
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_file(staging_path, schema)
+            writer.write_table(table)
+    finally:
+        reader.close()
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"{file_path} contains no listings")
+
+    cutoff = sketch.quantile(quantile)
+    categories = {col: sorted(values) for col, values in stats.categories.items()}
+    dtypes = stats.dtypes(cutoff)
+
+    report = {'rows': 0, 'bytes_before': 0, 'bytes_after': 0, 'nights_cutoff': cutoff}
+    writer = schema = None
+    try:
+        with pa.memory_map(staging_path) as source:
+            staged = pa.ipc.open_file(source)
+            for i in range(staged.num_record_batches):
+                df = staged.get_batch(i).to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+                df = df[within_nights_cutoff(df, cutoff)].reset_index(drop=True)
+                df, memory_report = apply_schema(df, categories, dtypes)
+                report['rows'] += len(df)
+                report['bytes_before'] += memory_report['bytes_before']
+                report['bytes_after'] += memory_report['bytes_after']
+
+                table = pa.Table.from_pandas(df, preserve_index=False, schema=schema)
+                if writer is None:
+                    schema = table.schema
+                    writer = pa.ipc.new_file(output_path, schema, options=pa.ipc.IpcWriteOptions(compression=None))
+                writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+        os.remove(staging_path)
+    return report
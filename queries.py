@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+import diagnostics
+from filters import ALL, intersect_sorted, take
+from recommender import DEFAULT_TOP_K
+
+# Comparative Analysis charts: name -> (group by, measure, statistic, top n); n=None keeps every group
+COMPARATIVE_QUERIES = {
+    'top_groups_by_price': ('neighbourhood group', 'price', 'mean', 5),
+    'top_groups_by_reviews': ('neighbourhood group', 'number of reviews', 'sum', 5),
+    'top_neighbourhoods_by_price': ('neighbourhood', 'price', 'mean', 5),
+    'top_neighbourhoods_by_reviews': ('neighbourhood', 'number of reviews', 'sum', 5),
+    'avg_price_by_room_type': ('room type', 'price', 'mean', None),
+    'avg_availability_by_room_type': ('room type', 'availability 365', 'mean', None),
+}
+
+AVAILABILITY_BINS = [0, 100, 200, 300, 365]
+AVAILABILITY_LABELS = ["0-100", "101-200", "201-300", "301-365"]
+
+RECOMMENDATION_COLUMNS = ['NAME', 'price', 'service fee', 'room type', 'minimum nights', 'availability 365',
+                          'reviews per month', 'last review', 'cancellation_policy']
+
+
+# Headline numbers on the Dashboard page
+@diagnostics.traced('query')
+def dashboard_kpis(dataset):
+    engine = dataset.engine
+    return {
+        'total_listings': int(engine.group_stat(None, None, 'rows')),
+        'average_price': float(engine.group_stat(None, 'price', 'mean')),
+        'average_availability': float(engine.group_stat(None, 'availability 365', 'mean')),
+        'total_reviews': int(engine.group_stat(None, 'number of reviews', 'sum')),
+    }
+
+
+# df[column].value_counts(), from the query engine; missing values are labelled 'Unknown' when kept
+@diagnostics.traced('query')
+def value_counts(dataset, column, dropna=True):
+    counts = dataset.engine.value_counts(column, dropna=dropna)
+    if not dropna:
+        counts.index = pd.Index(counts.index.astype(object)).fillna('Unknown')
+    return counts
+
+
+# One Comparative Analysis series, largest first for top-N queries
+@diagnostics.traced('query')
+def comparative(dataset, name):
+    by, measure, stat, n = COMPARATIVE_QUERIES[name]
+    result = dataset.engine.group_stat(by, measure, stat).dropna()
+    if n is None:
+        return result
+    return result.sort_values(ascending=False).head(n)
+
+
+# Row positions for the Listings Overview selectors, optionally limited to map areas: (south, west,
+# north, east) boxes whose listings are combined
+@diagnostics.traced('query')
+def listings_overview_rows(dataset, country=ALL, neighbourhood_group=ALL, neighbourhood=ALL, room_type=ALL, boxes=()):
+    rows = dataset.engine.select(equals=[('country', country), ('neighbourhood group', neighbourhood_group),
+                                         ('neighbourhood', neighbourhood), ('room type', room_type)])
+    if boxes:
+        rows = intersect_sorted(rows, area_rows(dataset, boxes))
+    return rows
+
+
+# Sorted row positions of listings inside any of the (south, west, north, east) boxes
+@diagnostics.traced('query')
+def area_rows(dataset, boxes):
+    return np.unique(np.concatenate([dataset.spatial.bbox(*box) for box in boxes]))
+
+
+# Sorted row positions of listings within `radius_km` of a point
+@diagnostics.traced('query')
+def nearby_rows(dataset, lat, lon, radius_km):
+    return dataset.spatial.radius(lat, lon, radius_km)
+
+
+# Listing counts per map tile at `zoom`, for the selected rows, the listings matching `where` (selector
+# column -> value) or the whole dataset
+@diagnostics.traced('query')
+def density_tiles(dataset, zoom, bbox=None, rows=None, where=None):
+    return dataset.spatial.density(zoom, bbox, rows, where)
+
+
+# Listings per availability band for the selected rows
+@diagnostics.traced('query')
+def availability_bands(dataset, rows):
+    availability = take(dataset.df, rows, ['availability 365'])['availability 365']
+    bands = pd.cut(availability, bins=AVAILABILITY_BINS, labels=AVAILABILITY_LABELS)
+    return bands.value_counts().sort_index()
+
+
+def _insights_filters(country, neighbourhood_group, neighbourhood, room_type, instant_bookable, cancellation_policy,
+                      min_nights, max_price):
+    return {'equals': [('country', country), ('neighbourhood group', neighbourhood_group),
+                       ('neighbourhood', neighbourhood), ('room type', room_type),
+                       ('instant_bookable', True if instant_bookable else ALL),
+                       ('cancellation_policy', cancellation_policy)],
+            'ranges': [('minimum nights', min_nights, None), ('price', None, max_price)]}
+
+
+# Row positions for the Detailed Insights sidebar filters
+@diagnostics.traced('query')
+def detailed_insights_rows(dataset, country=ALL, neighbourhood_group=ALL, neighbourhood=ALL, room_type=ALL,
+                           instant_bookable=False, cancellation_policy=ALL, min_nights=None, max_price=None):
+    return dataset.engine.select(**_insights_filters(country, neighbourhood_group, neighbourhood, room_type,
+                                                     instant_bookable, cancellation_policy, min_nights, max_price))
+
+
+# The same filters over the stratified sample: positions into dataset.sample, for the approximate mode
+@diagnostics.traced('query')
+def sampled_insights_rows(dataset, country=ALL, neighbourhood_group=ALL, neighbourhood=ALL, room_type=ALL,
+                          instant_bookable=False, cancellation_policy=ALL, min_nights=None, max_price=None):
+    return dataset.sample.filter_index.select(**_insights_filters(country, neighbourhood_group, neighbourhood,
+                                                                  room_type, instant_bookable, cancellation_policy,
+                                                                  min_nights, max_price))
+
+
+# Totals shown above the Detailed Insights histograms
+@diagnostics.traced('query')
+def detailed_insights_totals(dataset, rows):
+    selected = take(dataset.df, rows, ['id', 'calculated host listings count'])
+    return {
+        'total_visitors': int(selected['id'].nunique()),
+        'total_host_listings': selected['calculated host listings count'].sum().item(),
+    }
+
+
+# detailed_insights_totals estimated from sampled_insights_rows and the same filters, each an
+# Estimate(value, margin) with a 95% confidence interval; distinct visitors come from the HyperLogLog sketches
+@diagnostics.traced('query')
+def approximate_insights_totals(dataset, sample_rows, country=ALL, neighbourhood_group=ALL, neighbourhood=ALL,
+                                room_type=ALL, instant_bookable=False, cancellation_policy=ALL, min_nights=None,
+                                max_price=None):
+    filters = _insights_filters(country, neighbourhood_group, neighbourhood, room_type, instant_bookable,
+                                cancellation_policy, min_nights, max_price)
+    return {
+        'total_visitors': dataset.sample.distinct_ids(sample_rows, **filters),
+        'total_host_listings': dataset.sample.total(sample_rows, 'calculated host listings count'),
+    }
+
+
+# Best-scoring listings for a stay: row positions best first, their scores and how far the search
+# had to widen (an index into recommender.WIDENING; 0 is ±15% budget / ±2 nights in the neighbourhood).
+# room_type 'Any' matches every type.
+@diagnostics.traced('query')
+def recommendation_rows(dataset, neighbourhood_group, neighbourhood, budget, nights, room_type='Any', k=DEFAULT_TOP_K):
+    return dataset.recommender.recommend(neighbourhood_group, neighbourhood, budget, nights, room_type, k)
+
+
+@diagnostics.traced('query')
+def recommendations(dataset, neighbourhood_group, neighbourhood, budget, nights, room_type='Any', k=DEFAULT_TOP_K):
+    rows, scores, level = recommendation_rows(dataset, neighbourhood_group, neighbourhood, budget, nights, room_type,
+                                              k)
+    result = take(dataset.df, rows, RECOMMENDATION_COLUMNS)
+    result['total cost'] = result['price'] + result['service fee'] * nights
+    result['score'] = scores.round(3)
+    result.attrs['widening'] = level
+    return result
+
+
+# Review trend per `freq` bucket ('D', 'W' or 'M'), one column per value of `by` (or a single series),
+# from the pre-bucketed rollups; see ReviewTrends.trend
+@diagnostics.traced('query')
+def review_trends(dataset, freq='M', measure='listings', by=None, where=None, start=None, end=None, window=None):
+    return dataset.trends.trend(freq, measure, where, by, start, end, window)
@@ -0,0 +1,95 @@
+import numpy as np
+
+from filters import ALL
+
+DEFAULT_TOP_K = 10
+
+# Search windows tried in order until at least `k` listings qualify: (budget tolerance as a fraction,
+# minimum-nights window in nights, area). The first is the page's original ±15% / ±2 nights rule.
+WIDENING = [
+    (0.15, 2, 'neighbourhood'),
+    (0.30, 4, 'neighbourhood'),
+    (0.50, 7, 'neighbourhood'),
+    (0.50, 7, 'neighbourhood group'),
+]
+
+# Relative weight of each score component; components are all in [0, 1]
+WEIGHTS = {
+    'price_fit': 3.0,
+    'nights_fit': 1.5,
+    'availability': 1.0,
+    'activity': 1.0,
+    'recency': 1.0,
+    'cancellation': 0.5,
+}
+
+CANCELLATION_SCORES = {'flexible': 1.0, 'moderate': 0.6, 'strict': 0.3}
+
+# Reviews per month at which the activity score saturates, and the review age (days) at which the
+# recency score has fallen to 1/e
+ACTIVITY_SATURATION = 5.0
+RECENCY_DAYS = 365.0
+
+
+# Scores every listing for the Recommendation page. The query-independent part of the score
+# (availability, review activity and recency, cancellation policy) is computed once per dataset
+# version; a query only fits price and nights for its candidate rows and picks the top K with
+# argpartition. Candidate filters run on `engine` (see engines.py, or a FilterIndex).
+class Recommender:
+    def __init__(self, df, engine):
+        self.engine = engine
+        self.price = df['price'].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.fee = df['service fee'].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.nights = df['minimum nights'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        availability = df['availability 365'].to_numpy(dtype=np.float64, na_value=0)
+        activity = df['reviews per month'].to_numpy(dtype=np.float64, na_value=0)
+        last_review = df['last review'].to_numpy(dtype='datetime64[D]')
+        reviewed = ~np.isnat(last_review)
+        age = np.zeros(len(df))
+        if reviewed.any():
+            age[reviewed] = (last_review[reviewed].max() - last_review[reviewed]).astype(np.float64)
+        recency = np.where(reviewed, np.exp(-age / RECENCY_DAYS), 0.0)
+        policy = df['cancellation_policy'].astype(object).map(CANCELLATION_SCORES)
+        cancellation = policy.fillna(0.0).to_numpy(dtype=np.float64)
+
+        self.static_score = (WEIGHTS['availability'] * np.clip(availability / 365, 0, 1)
+                             + WEIGHTS['activity'] * np.log1p(np.clip(activity, 0, ACTIVITY_SATURATION))
+                             / np.log1p(ACTIVITY_SATURATION)
+                             + WEIGHTS['recency'] * recency
+                             + WEIGHTS['cancellation'] * cancellation).astype(np.float32)
+
+    # Rows in the area whose total cost and minimum stay are inside one search window
+    def candidates(self, neighbourhood_group, neighbourhood, budget, nights, room_type, window):
+        tolerance, nights_window, area = window
+        upper = budget * (1 + tolerance)
+        rows = self.engine.select(
+            equals=[('neighbourhood group', neighbourhood_group),
+                    ('neighbourhood', neighbourhood if area == 'neighbourhood' else ALL),
+                    ('room type', ALL if room_type == 'Any' else room_type)],
+            ranges=[('minimum nights', max(1, nights - nights_window), nights + nights_window),
+                    ('price', None, upper), ('service fee', None, upper / nights)])
+        total = self.price[rows] + self.fee[rows] * nights
+        return rows[(total >= budget * (1 - tolerance)) & (total <= upper)]
+
+    def score(self, rows, budget, nights, window):
+        tolerance, nights_window, _ = window
+        total = self.price[rows] + self.fee[rows] * nights
+        price_fit = 1 - np.abs(total - budget) / max(budget * tolerance, 1e-9)
+        nights_fit = 1 - np.abs(self.nights[rows] - nights) / (nights_window + 1)
+        return (self.static_score[rows] + WEIGHTS['price_fit'] * np.clip(price_fit, 0, 1)
+                + WEIGHTS['nights_fit'] * np.clip(nights_fit, 0, 1))
+
+    # Best `k` rows, best first, with their scores and the index of the WIDENING window used.
+    # Windows widen until k listings qualify; the widest window's matches are returned otherwise.
+    def recommend(self, neighbourhood_group, neighbourhood, budget, nights, room_type='Any', k=DEFAULT_TOP_K):
+        for level, window in enumerate(WIDENING):
+            rows = self.candidates(neighbourhood_group, neighbourhood, budget, nights, room_type, window)
+            if len(rows) >= k:
+                break
+        scores = self.score(rows, budget, nights, window)
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return rows[order], scores[order], level
@@ -0,0 +1,70 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality string columns the pages filter and group on
+CATEGORICAL_COLUMNS = ['country', 'neighbourhood group', 'neighbourhood', 'room type', 'cancellation_policy']
+
+# Count-like columns that never need 64 bits
+DOWNCAST_COLUMNS = ['availability 365', 'minimum nights', 'number of reviews', 'calculated host listings count']
+
+BOOLEAN_COLUMN = 'instant_bookable'
+_TRUE_VALUES = {'true', 't', 'yes', '1'}
+_FALSE_VALUES = {'false', 'f', 'no', '0'}
+
+
+def memory_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+# 'TRUE'/'FALSE'/True/False -> nullable boolean; anything else (e.g. 'Unknown') becomes <NA>
+def parse_bool(series):
+    normalized = series.astype('string').str.strip().str.lower()
+    parsed = pd.Series(pd.NA, index=series.index, dtype='boolean')
+    parsed[normalized.isin(_TRUE_VALUES)] = True
+    parsed[normalized.isin(_FALSE_VALUES)] = False
+    return parsed
+
+
+# Smallest dtype that holds every value in [low, high]. Integers stay integers only when there is
+# nothing to lose (no NaN, no fractions).
+def downcast_dtype(low, high, has_missing, integral):
+    bounds = pd.Series([low, high], dtype='float64')
+    if not has_missing and integral:
+        return pd.to_numeric(bounds.astype('int64'), downcast='integer').dtype
+    return pd.to_numeric(bounds, downcast='float').dtype
+
+
+# Smallest dtype for the values actually in `series`
+def series_downcast_dtype(series):
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = values[~np.isnan(values)]
+    if len(valid) == 0:
+        return np.dtype('float32')
+    return downcast_dtype(valid.min(), valid.max(), len(valid) < len(values), bool((valid % 1 == 0).all()))
+
+
+# Convert the cleaned frame to its compact dtypes and report the saving. Chunked ingest passes the
+# dataset-wide `categories` and `dtypes` so every chunk ends up with the same schema; otherwise both
+# are inferred from `df`.
+def apply_schema(df, categories=None, dtypes=None):
+    before = memory_bytes(df)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            if categories is None:
+                df[col] = df[col].astype('category')
+            else:
+                df[col] = pd.Categorical(df[col], categories=categories[col])
+    for col in DOWNCAST_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(dtypes[col] if dtypes is not None else series_downcast_dtype(df[col]))
+    if BOOLEAN_COLUMN in df.columns:
+        df[BOOLEAN_COLUMN] = parse_bool(df[BOOLEAN_COLUMN])
+    after = memory_bytes(df)
+
+    report = {'bytes_before': before, 'bytes_after': after}
+    logger.info("Listings frame: %.1f MB -> %.1f MB", before / 1e6, after / 1e6)
+    return df, report
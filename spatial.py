@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import cell_entries, select_cells
+from filters import ALL
+
+# Listings are bucketed on Web Mercator map tiles ("slippy map" x/y at a zoom level), so density
+# tiles line up with what a map shows at that zoom. FINE_ZOOM tiles are ~100 m across in NYC.
+FINE_ZOOM = 18
+TILE_ZOOMS = [10, 12, 14, 16]
+MAX_LATITUDE = 85.05112878
+EARTH_RADIUS_KM = 6371.0088
+
+# Tile counts are also kept per combination of these (the Listings Overview selectors)
+CELL_DIMENSIONS = ['country', 'neighbourhood group', 'neighbourhood', 'room type']
+
+
+def tile_xy(lat, lon, zoom):
+    n = 2 ** zoom
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(lon) + 180) / 360 * n)
+    y = np.floor((1 - np.arcsinh(np.tan(lat)) / np.pi) / 2 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+# (south, west, north, east) of tiles x/y at `zoom`
+def tile_bounds(x, y, zoom):
+    n = 2 ** zoom
+
+    def latitude(row):
+        return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(row) / n))))
+
+    return latitude(np.asarray(y) + 1), np.asarray(x) / n * 360 - 180, latitude(y), (np.asarray(x) + 1) / n * 360 - 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+# Grid index over lat/long. Row positions are sorted by fine tile key (tile row, then column), so a
+# bounding box is one contiguous key range per tile row, found by binary search; only the listings in
+# those tiles are checked against the exact box. Listing counts per tile are precomputed for
+# TILE_ZOOMS, overall and per CELL_DIMENSIONS cell, so density maps never touch individual rows.
+class SpatialIndex:
+    def __init__(self, df):
+        self.lat = df['lat'].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.lon = df['long'].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = (np.isfinite(self.lat) & np.isfinite(self.lon) & (np.abs(self.lat) <= MAX_LATITUDE)
+                 & (np.abs(self.lon) <= 180))
+        located = np.flatnonzero(valid).astype(np.int32)
+
+        # Fine tile per row, -1 where the listing has no usable location
+        self.x = np.full(len(df), -1, dtype=np.int64)
+        self.y = np.full(len(df), -1, dtype=np.int64)
+        self.x[located], self.y[located] = tile_xy(self.lat[located], self.lon[located], FINE_ZOOM)
+
+        keys = (self.y[located] << FINE_ZOOM) | self.x[located]
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.rows = located[order]
+        self.tiles = {zoom: self._count_tiles(self.rows, zoom) for zoom in TILE_ZOOMS}
+
+        # Per cell and zoom: (offsets, tile keys, counts) with cell c's tiles at offsets[c]:offsets[c + 1]
+        dimensions = [col for col in CELL_DIMENSIONS if col in df.columns]
+        grouped = df.groupby([df[col] for col in dimensions], observed=True, dropna=False, sort=False)
+        row_cells = grouped.ngroup().to_numpy().astype(np.int64)
+        self.cell_keys = grouped.size().index.to_frame(index=False)
+        self.cell_tiles = {zoom: self._count_cell_tiles(row_cells[self.rows], zoom) for zoom in TILE_ZOOMS}
+
+    def _count_tiles(self, rows, zoom):
+        shift = FINE_ZOOM - zoom
+        keys = ((self.y[rows] >> shift) << zoom) | (self.x[rows] >> shift)
+        return np.unique(keys, return_counts=True)
+
+    def _count_cell_tiles(self, cells, zoom):
+        shift = FINE_ZOOM - zoom
+        tiles = ((self.y[self.rows] >> shift) << zoom) | (self.x[self.rows] >> shift)
+        keys, counts = np.unique((cells << (2 * zoom)) | tiles, return_counts=True)
+        offsets = np.searchsorted(keys >> (2 * zoom), np.arange(len(self.cell_keys) + 1))
+        return offsets, keys & ((1 << (2 * zoom)) - 1), counts
+
+    # Tile counts merged over the cells matching `where`
+    def _merge_cells(self, zoom, where):
+        offsets, tiles, counts = self.cell_tiles[zoom]
+        entries = cell_entries(offsets, select_cells(self.cell_keys, where))
+        if len(entries) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        keys, slots = np.unique(tiles[entries], return_inverse=True)
+        return keys, np.bincount(slots, weights=counts[entries]).astype(np.int64)
+
+    # Sorted row positions of listings inside the box (inclusive)
+    def bbox(self, south, west, north, east):
+        x0, y0 = tile_xy(north, west, FINE_ZOOM)
+        x1, y1 = tile_xy(south, east, FINE_ZOOM)
+        tile_rows = np.arange(y0, y1 + 1, dtype=np.int64) << FINE_ZOOM
+        starts = np.searchsorted(self.keys, tile_rows | x0, side='left')
+        stops = np.searchsorted(self.keys, tile_rows | x1, side='right')
+        if not (stops > starts).any():
+            return np.empty(0, dtype=np.int32)
+        candidates = np.concatenate([self.rows[start:stop] for start, stop in zip(starts, stops) if stop > start])
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return np.sort(candidates[inside])
+
+    # Sorted row positions of listings within `radius_km` of (lat, lon)
+    def radius(self, lat, lon, radius_km):
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        candidates = self.bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        distance = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        return candidates[distance <= radius_km]
+
+    # Listing count per map tile at `zoom` (0..FINE_ZOOM, and one of TILE_ZOOMS when filtering by `where`;
+    # ValueError otherwise): tile x/y, centre lat/long and bounds, optionally limited to tiles touching `bbox`
+    # (south, west, north, east) and to the listings matching `where` (CELL_DIMENSIONS -> value, 'All'
+    # ignored) or at row positions `rows`
+    def density(self, zoom, bbox=None, rows=None, where=None):
+        if not 0 <= zoom <= FINE_ZOOM:
+            raise ValueError(f"zoom must be between 0 and {FINE_ZOOM}")
+        active = {col: value for col, value in (where or {}).items() if not (isinstance(value, str) and value == ALL)}
+        if active and rows is None:
+            if zoom not in self.cell_tiles:
+                raise ValueError(f"zoom must be one of {TILE_ZOOMS} when filtering by {list(active)}")
+            keys, counts = self._merge_cells(zoom, active)
+        elif rows is None:
+            keys, counts = self.tiles[zoom] if zoom in self.tiles else self._count_tiles(self.rows, zoom)
+        else:
+            rows = np.asarray(rows)
+            keys, counts = self._count_tiles(rows[self.x[rows] >= 0], zoom)
+        x, y = keys & (2 ** zoom - 1), keys >> zoom
+        if bbox is not None:
+            south, west, north, east = bbox
+            x0, y0 = tile_xy(north, west, zoom)
+            x1, y1 = tile_xy(south, east, zoom)
+            keep = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+            x, y, counts = x[keep], y[keep], counts[keep]
+        south, west, north, east = tile_bounds(x, y, zoom)
+        return pd.DataFrame({'x': x, 'y': y, 'lat': (south + north) / 2, 'long': (west + east) / 2,
+                             'south': south, 'west': west, 'north': north, 'east': east, 'count': counts})
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# The dashboard modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Cleaned frame of benchmark.py's synthetic export, shared by the tests that need a realistic dataset
+@pytest.fixture(scope='session')
+def listings(tmp_path_factory):
+    from benchmark import write_synthetic_csv
+    from data_loader import load_data
+
+    workdir = tmp_path_factory.mktemp('listings')
+    csv_path = write_synthetic_csv(os.path.join(workdir, 'listings.csv'), 50_000, seed=1)
+    return load_data(csv_path, os.path.join(workdir, 'snapshot'))
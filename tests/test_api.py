@@ -0,0 +1,68 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import api
+from dataset import Dataset
+
+
+class FixedDataset:
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def refresh(self):
+        return self.dataset
+
+
+@pytest.fixture(scope='module')
+def server(listings):
+    server = api.serve(port=0, live_dataset=FixedDataset(Dataset(listings)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def get(server, path, connection=None):
+    connection = connection or http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_density_returns_tiles(server):
+    status, tiles = get(server, '/density?zoom=10')
+    assert status == 200 and sum(tile['count'] for tile in tiles) > 0
+
+
+@pytest.mark.parametrize('zoom', [20, 64])
+def test_density_rejects_zoom_past_fine_zoom(server, zoom):
+    status, body = get(server, f'/density?zoom={zoom}')
+    assert status == 400 and 'zoom' in body['error']
+
+
+@pytest.mark.parametrize('path', ['/trends?window=-3', '/trends?window=0',
+                                  '/listings?lat=40.7&lon=-73.9&radius_km=-1', '/listings?lat=95&lon=-73.9&radius_km=1',
+                                  '/listings?bbox=40.8,-73.9,40.7,-73.8', '/listings?bbox=40.7,-73.9',
+                                  '/recommendations?neighbourhood_group=Brooklyn&neighbourhood=Williamsburg&budget=-5'
+                                  '&nights=3',
+                                  '/recommendations?neighbourhood_group=Brooklyn&neighbourhood=Williamsburg&budget=500'
+                                  '&nights=0',
+                                  '/recommendations?neighbourhood_group=Brooklyn&neighbourhood=Williamsburg&budget=500'
+                                  '&nights=3&k=0'])
+def test_out_of_range_parameters_are_rejected(server, path):
+    status, body = get(server, path)
+    assert status == 400 and body['error'].startswith('bad query')
+
+
+# A failing route still gets a status line, and the keep-alive connection stays usable
+def test_unexpected_errors_answer_500(server, monkeypatch):
+    def broken(dataset, params):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(api.ROUTES, '/broken', broken)
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    status, body = get(server, '/broken', connection)
+    assert status == 500 and body == {'error': 'internal error: RuntimeError'}
+    assert get(server, '/kpis', connection)[0] == 200
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import queries
+from approximate import HLL_PRECISION, hll_merge, hll_sketches
+from dataset import Dataset
+from filters import ALL
+
+
+@pytest.fixture(scope='module')
+def dataset(listings):
+    return Dataset(listings)
+
+
+def visitors(dataset, *filters):
+    exact = queries.detailed_insights_totals(dataset, queries.detailed_insights_rows(dataset, *filters))
+    estimate = queries.approximate_insights_totals(dataset, queries.sampled_insights_rows(dataset, *filters), *filters)
+    return exact['total_visitors'], estimate['total_visitors']
+
+
+# Equality filters only: the merged cell sketches see every listing, so only the HLL error remains
+@pytest.mark.parametrize('group, instant', [(ALL, False), ('Brooklyn', False), ('Manhattan', True)])
+def test_distinct_ids_merge_cell_sketches(dataset, group, instant):
+    exact, estimate = visitors(dataset, ALL, group, ALL, ALL, instant, ALL)
+    assert abs(estimate.value - exact) <= estimate.margin
+    assert estimate.margin < 0.05 * exact
+
+
+# Range filters fall back to the sampled row estimate, with a correspondingly wider interval
+def test_distinct_ids_with_ranges_fall_back_to_sample(dataset):
+    nights = int(dataset.catalog.numeric['minimum nights']['median'])
+    price = int(dataset.catalog.numeric['price']['median'])
+    exact, estimate = visitors(dataset, ALL, 'Brooklyn', ALL, ALL, False, ALL, nights, price)
+    assert abs(estimate.value - exact) <= estimate.margin
+
+
+# The sparse sketches merge to exactly the dense registers, and never hold more entries than rows
+def test_sparse_sketches_merge_like_dense_registers():
+    rng = np.random.default_rng(0)
+    ids, groups = rng.integers(0, 5000, 20000), rng.integers(0, 300, 20000)
+    sketches = hll_sketches(ids, groups, 300)
+    offsets = sketches[0]
+    assert (np.diff(offsets) <= np.bincount(groups, minlength=300)).all()
+
+    hashes = pd.util.hash_array(ids.astype(object))
+    buckets = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    _, bit_length = np.frexp((hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)).astype(np.float64))
+    for selected in [np.ones(300, dtype=bool), np.arange(300) % 7 == 0, np.zeros(300, dtype=bool)]:
+        dense = np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+        chosen = selected[groups]
+        np.maximum.at(dense, buckets[chosen], (64 - HLL_PRECISION + 1 - bit_length[chosen]).astype(np.uint8))
+        np.testing.assert_array_equal(hll_merge(sketches, selected), dense)
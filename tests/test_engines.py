@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('duckdb')
+
+import engines  # noqa: E402
+import queries  # noqa: E402
+from aggregates import AggregateCube  # noqa: E402
+from catalog import Catalog  # noqa: E402
+from dataset import Dataset  # noqa: E402
+from engines import DuckDBEngine, PandasEngine  # noqa: E402
+from filters import ALL, FilterIndex  # noqa: E402
+from queries import COMPARATIVE_QUERIES  # noqa: E402
+from recommender import Recommender  # noqa: E402
+
+# Random filter combinations drawn per page, each from its own seed
+CASES = 40
+
+
+@pytest.fixture(scope='module')
+def reference(listings):
+    return PandasEngine(listings, FilterIndex(listings), AggregateCube(listings))
+
+
+@pytest.fixture(scope='module')
+def duckdb_engine(listings, tmp_path_factory):
+    return DuckDBEngine(listings, parquet_dir=str(tmp_path_factory.mktemp('parquet')))
+
+
+@pytest.fixture(scope='module')
+def catalog(listings, reference):
+    return Catalog(listings, reference)
+
+
+def pick(rng, values):
+    return values[rng.integers(len(values))]
+
+
+def same_series(expected, actual):
+    expected = expected.set_axis(expected.index.astype(object).astype(str)).sort_index()
+    actual = actual.set_axis(actual.index.astype(object).astype(str)).sort_index()
+    assert expected.index.equals(actual.index)
+    np.testing.assert_allclose(actual.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64))
+
+
+# The Detailed Insights sidebar filters
+@pytest.mark.parametrize('seed', range(CASES))
+def test_select_matches_pandas(reference, duckdb_engine, catalog, seed):
+    rng = np.random.default_rng(seed)
+    nights, price = catalog.numeric['minimum nights'], catalog.numeric['price']
+    group = pick(rng, [ALL] + catalog.values['neighbourhood group'])
+    equals = [('country', pick(rng, [ALL] + catalog.values['country'])), ('neighbourhood group', group),
+              ('neighbourhood', pick(rng, [ALL] + catalog.neighbourhoods.get(group, [])) if group != ALL else ALL),
+              ('room type', pick(rng, [ALL] + catalog.values['room type'])),
+              ('instant_bookable', pick(rng, [ALL, True])),
+              ('cancellation_policy', pick(rng, [ALL] + catalog.values['cancellation_policy']))]
+    ranges = [('minimum nights', int(rng.integers(int(nights['min']), int(nights['median']) + 1)), None),
+              ('price', None, int(rng.integers(int(price['min']), int(price['max']) + 1)))]
+    np.testing.assert_array_equal(duckdb_engine.select(equals, ranges), reference.select(equals, ranges))
+
+
+# The Recommendation page, widening included
+@pytest.mark.parametrize('seed', range(CASES))
+def test_recommendations_match_pandas(listings, reference, duckdb_engine, catalog, seed):
+    rng = np.random.default_rng(seed)
+    group = pick(rng, catalog.values['neighbourhood group'])
+    query = (group, pick(rng, catalog.neighbourhoods[group]), float(rng.integers(50, 3000)), int(rng.integers(1, 8)),
+             pick(rng, ['Any'] + catalog.values['room type']))
+    rows, scores, level = Recommender(listings, reference).recommend(*query)
+    other_rows, other_scores, other_level = Recommender(listings, duckdb_engine).recommend(*query)
+    assert other_level == level
+    np.testing.assert_array_equal(other_rows, rows)
+    np.testing.assert_allclose(other_scores, scores)
+
+
+@pytest.mark.parametrize('name', sorted(COMPARATIVE_QUERIES))
+def test_group_stat_matches_pandas(reference, duckdb_engine, name):
+    by, measure, stat, _ = COMPARATIVE_QUERIES[name]
+    same_series(reference.group_stat(by, measure, stat), duckdb_engine.group_stat(by, measure, stat))
+
+
+# The Dashboard KPIs
+@pytest.mark.parametrize('measure, stat', [(None, 'rows'), ('price', 'mean'), ('availability 365', 'mean'),
+                                           ('number of reviews', 'sum')])
+def test_overall_stat_matches_pandas(reference, duckdb_engine, measure, stat):
+    assert duckdb_engine.group_stat(None, measure, stat) == pytest.approx(reference.group_stat(None, measure, stat))
+
+
+@pytest.mark.parametrize('column', ['room type', 'instant_bookable', 'cancellation_policy', 'neighbourhood group'])
+@pytest.mark.parametrize('dropna', [True, False])
+def test_value_counts_match_pandas(reference, duckdb_engine, column, dropna):
+    expected, actual = reference.value_counts(column, dropna), duckdb_engine.value_counts(column, dropna)
+    same_series(expected, actual)
+    # Same order too: largest first
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
+
+
+# Under DuckDB the posting-list index and cube are skipped, and every page query still answers
+def test_duckdb_dataset_skips_in_memory_indexes(listings, reference, monkeypatch, tmp_path):
+    monkeypatch.setenv('QUERY_ENGINE', 'pandas')
+    expected = Dataset(listings)
+    monkeypatch.setenv('QUERY_ENGINE', 'duckdb')
+    monkeypatch.setattr(engines, 'PARQUET_DIR', str(tmp_path))
+    dataset = Dataset(listings)
+    assert dataset.filter_index is None and dataset.cube is None
+
+    assert queries.dashboard_kpis(dataset) == pytest.approx(queries.dashboard_kpis(expected))
+    np.testing.assert_array_equal(queries.listings_overview_rows(dataset, neighbourhood_group='Brooklyn'),
+                                  reference.select([('neighbourhood group', 'Brooklyn')]))
+    np.testing.assert_array_equal(dataset.histograms.histogram('price').counts,
+                                  expected.histograms.histogram('price').counts)
+    assert dataset.catalog.options('neighbourhood', [('neighbourhood group', 'Brooklyn')]) == \
+        expected.catalog.options('neighbourhood', [('neighbourhood group', 'Brooklyn')])
+
+
+# Frames built without load_data have no version; an edited one must not reuse the earlier export
+def test_unversioned_frames_are_exported_by_content(listings, tmp_path):
+    frame = listings.head(1000).copy()
+    frame.attrs = {}
+    engine = DuckDBEngine(frame, parquet_dir=str(tmp_path))
+    assert DuckDBEngine(frame.copy(), parquet_dir=str(tmp_path)).path == engine.path
+
+    current = frame['room type'].iloc[0]
+    frame.loc[frame.index[0], 'room type'] = 'Hotel room' if current == 'Shared room' else 'Shared room'
+    edited = DuckDBEngine(frame, parquet_dir=str(tmp_path))
+    assert edited.path != engine.path
+    expected = int((frame['room type'] == 'Shared room').sum())
+    assert edited.value_counts('room type')['Shared room'] == expected
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import AggregateCube
+from histograms import FINE_BINS, REBIN_BELOW, Histogram, HistogramStore, fine_bins
+
+
+# Direct Gaussian KDE (Scott's rule) of the binned listings, scaled to listings per display bin
+def direct_kde(x, points, display_width):
+    bandwidth = points.std(ddof=1) * len(points) ** (-1 / 5)
+    z = (x[:, None] - points[None, :]) / bandwidth
+    return np.exp(-0.5 * z ** 2).sum(axis=1) / (bandwidth * np.sqrt(2 * np.pi)) * display_width
+
+
+def check_density(bins):
+    edges = np.linspace(0.0, 240.0, FINE_BINS + 1)
+    counts = np.bincount(bins, minlength=FINE_BINS)
+    hist = Histogram(counts, edges)
+    x, y = hist.density(display_width=12.0)
+    centers = (edges[:-1] + edges[1:]) / 2
+    expected = direct_kde(x, centers[bins], 12.0)
+    np.testing.assert_allclose(y, expected, rtol=1e-3, atol=1e-6 * expected.max())
+    return x, y
+
+
+# Few, widely spread listings: the kernel is wider than the fine bins
+def test_density_matches_direct_kde_for_wide_kernel():
+    x, y = check_density(np.array([10, 10, 10, 200, 200]))
+    # Three of the five listings are at the low end
+    assert x[np.argmax(y)] < 100
+
+
+def test_density_matches_direct_kde_for_narrow_kernel():
+    rng = np.random.default_rng(0)
+    check_density(np.clip(rng.normal(120, 15, 5000).astype(int), 0, FINE_BINS - 1))
+
+
+@pytest.fixture(scope='module')
+def store(listings):
+    return HistogramStore(listings, AggregateCube(listings))
+
+
+# Fine-bin counts per cell straight from the rows, the dense table the sparse store replaces
+def dense_cell_counts(store, measure):
+    cube = store.cube
+    valid = store.bin_ids[measure] < FINE_BINS
+    counts = np.zeros((len(cube.keys), FINE_BINS), dtype=np.int64)
+    np.add.at(counts, (cube.row_cells[valid], store.bin_ids[measure][valid]), 1)
+    return counts
+
+
+@pytest.mark.parametrize('where', [None, {'neighbourhood group': 'Brooklyn'},
+                                   {'room type': 'Private room', 'instant_bookable': True}])
+def test_cell_merge_matches_rows(store, where):
+    expected = dense_cell_counts(store, 'price')
+    mask = np.ones(len(store.cube.keys), dtype=bool)
+    for col, value in (where or {}).items():
+        mask &= (store.cube.keys[col] == value).to_numpy(dtype=bool, na_value=False)
+    np.testing.assert_array_equal(store.histogram('price', where).counts, expected[mask].sum(axis=0))
+
+
+def test_cell_counts_are_sparse(store):
+    offsets, bins, counts = store.cell_counts['price']
+    assert bins.nbytes + counts.nbytes + offsets.nbytes < dense_cell_counts(store, 'price').astype(np.int32).nbytes / 4
+
+
+# The sparse table expanded back to cells x fine bins
+def expanded_cell_counts(store, measure):
+    offsets, bins, counts = store.cell_counts[measure]
+    dense = np.zeros((len(offsets) - 1, FINE_BINS), dtype=np.int64)
+    dense[np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)), bins] = counts
+    return dense
+
+
+# An upsert drops some rows and appends new ones; the updated counts match counting the new frame
+def test_apply_delta_matches_rebuild(listings):
+    old = listings.iloc[:20000].reset_index(drop=True)
+    cube = AggregateCube(old)
+    keep = np.ones(len(old), dtype=bool)
+    keep[::7] = False
+    new = pd.concat([old[keep], listings.iloc[20000:21000]], ignore_index=True)
+    updated = HistogramStore(old, cube).apply_delta(new, keep, cube.apply_delta(old, new, keep))
+
+    for measure, edges in updated.edges.items():
+        values = new[measure].to_numpy(dtype=np.float64, na_value=np.nan)
+        np.testing.assert_array_equal(updated.bin_ids[measure], fine_bins(values, edges))
+        expected = dense_cell_counts(updated, measure)
+        np.testing.assert_array_equal(expanded_cell_counts(updated, measure), expected)
+        np.testing.assert_array_equal(updated.totals[measure], expected.sum(axis=0))
+
+
+# One far outlier stretches the fine bins; a subset without it is re-binned over its own range
+def test_narrow_subset_is_rebinned_from_values():
+    rng = np.random.default_rng(0)
+    prices = np.append(rng.uniform(50, 1200, 5000).round(), 24000.0)
+    store = HistogramStore(pd.DataFrame({'price': prices}), None)
+    rows = np.arange(5000)
+    assert np.count_nonzero(np.bincount(store.bin_ids['price'][rows])) < REBIN_BELOW
+
+    hist = store.histogram('price', rows=rows)
+    assert hist.edges[0] == prices[:5000].min() and hist.edges[-1] == prices[:5000].max()
+    edges, counts = hist.rebin(30)
+    assert len(counts) == 30 and counts.sum() == 5000
+    np.testing.assert_array_equal(counts, np.histogram(prices[:5000], bins=30)[0])
+
+    # The full frame still spans the outlier
+    assert store.histogram('price', rows=np.arange(5001)).edges[-1] == 24000.0
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from spatial import FINE_ZOOM, TILE_ZOOMS, SpatialIndex
+
+
+@pytest.fixture(scope='module')
+def spatial():
+    rng = np.random.default_rng(0)
+    return SpatialIndex(pd.DataFrame({'lat': rng.uniform(40.5, 40.9, 1000), 'long': rng.uniform(-74.2, -73.7, 1000),
+                                      'neighbourhood group': rng.choice(['Brooklyn', 'Queens'], 1000)}))
+
+
+@pytest.mark.parametrize('zoom', [0, TILE_ZOOMS[0], 13, FINE_ZOOM])
+def test_density_counts_every_located_listing(spatial, zoom):
+    tiles = spatial.density(zoom)
+    assert tiles['count'].sum() == 1000
+    assert tiles['x'].between(0, 2 ** zoom - 1).all() and tiles['y'].between(0, 2 ** zoom - 1).all()
+
+
+# Past FINE_ZOOM the tile shift goes negative (every listing lands in tile 0/0) and at 64 it overflows
+@pytest.mark.parametrize('zoom', [-1, FINE_ZOOM + 2, 64])
+def test_density_rejects_zoom_outside_fine_zoom(spatial, zoom):
+    with pytest.raises(ValueError):
+        spatial.density(zoom)
+    with pytest.raises(ValueError):
+        spatial.density(zoom, rows=np.arange(10))
+
+
+def test_density_by_cell_needs_a_precomputed_zoom(spatial):
+    with pytest.raises(ValueError):
+        spatial.density(13, where={'neighbourhood group': 'Brooklyn'})
+    counts = [spatial.density(TILE_ZOOMS[0], where={'neighbourhood group': group})['count'].sum()
+              for group in ['Brooklyn', 'Queens']]
+    assert sum(counts) == 1000
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import select_cells
+
+# Trends are kept per combination of these values
+TREND_DIMENSIONS = ['neighbourhood group', 'room type']
+
+# Bucket sizes rolled up at load time: day, week (starting Monday) and calendar month
+FREQUENCIES = ['D', 'W', 'M']
+FREQUENCY_NAMES = {'D': 'Day', 'W': 'Week', 'M': 'Month'}
+
+TREND_MEASURES = ['listings', 'reviews per month']
+
+
+def _period_starts(dates, freq):
+    if freq == 'D':
+        return dates
+    if freq == 'W':
+        # 1970-01-01 was a Thursday
+        return dates - ((dates.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+    return dates.astype('datetime64[M]').astype('datetime64[D]')
+
+
+# Listings by `last review` date, bucketed per day, week and month for every neighbourhood group /
+# room type cell. Each bucket holds the number of listings last reviewed in it and the sum of their
+# `reviews per month`. Trend queries sum the matching cells' buckets, never the raw rows.
+class ReviewTrends:
+    def __init__(self, df, dimensions=TREND_DIMENSIONS):
+        self.dimensions = [col for col in dimensions if col in df.columns]
+        grouped = df.groupby([df[col] for col in self.dimensions], observed=True, dropna=False, sort=False)
+        row_cells = grouped.ngroup().to_numpy().astype(np.int64)
+        self.keys = grouped.size().index.to_frame(index=False)
+        n_cells = len(self.keys)
+
+        days = df['last review'].to_numpy(dtype='datetime64[D]')
+        activity = df['reviews per month'].to_numpy(dtype=np.float64, na_value=0)
+        reviewed = ~np.isnat(days)
+        self.rollups = {}
+        if not reviewed.any():
+            empty = np.zeros((n_cells, 0))
+            self.rollups = {freq: (np.empty(0, dtype='datetime64[D]'), empty, empty) for freq in FREQUENCIES}
+            return
+
+        first, last = days[reviewed].min(), days[reviewed].max()
+        n_days = int((last - first).astype(np.int64)) + 1
+        slots = row_cells[reviewed] * n_days + (days[reviewed] - first).astype(np.int64)
+        counts = np.bincount(slots, minlength=n_cells * n_days).reshape(n_cells, n_days)
+        sums = np.bincount(slots, weights=activity[reviewed], minlength=n_cells * n_days).reshape(n_cells, n_days)
+
+        dates = first + np.arange(n_days).astype('timedelta64[D]')
+        for freq in FREQUENCIES:
+            periods = _period_starts(dates, freq)
+            bounds = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+            self.rollups[freq] = (periods[bounds], np.add.reduceat(counts, bounds, axis=1),
+                                  np.add.reduceat(sums, bounds, axis=1))
+
+    # First and last bucket dates (numpy datetime64[D]), or None when no listing has a review date
+    def date_range(self):
+        periods = self.rollups['D'][0]
+        return (periods[0], periods[-1]) if len(periods) else None
+
+    # Trend of `measure` ('listings' or 'reviews per month', the mean over those listings) per `freq`
+    # bucket between `start` and `end` (inclusive dates, either open), for the cells matching `where`.
+    # `by` splits it into one column per value of that dimension; `window` > 1 replaces each bucket
+    # with the trailing mean over that many buckets, from running sums in one pass.
+    def trend(self, freq='M', measure='listings', where=None, by=None, start=None, end=None, window=None):
+        periods, counts, sums = self.rollups[freq]
+        lo = 0 if start is None else int(np.searchsorted(periods, _period_starts(np.datetime64(start, 'D'), freq)))
+        hi = len(periods) if end is None else int(np.searchsorted(periods, np.datetime64(end, 'D'), side='right'))
+        index = pd.DatetimeIndex(periods[lo:hi], name='last review')
+
+        selected = select_cells(self.keys, where)
+        groups = [(None, selected)] if by is None else [
+            (value, selected & (self.keys[by] == value).to_numpy(dtype=bool, na_value=False))
+            for value in self.keys.loc[selected, by].dropna().unique()]
+
+        columns = {}
+        for value, cells in groups:
+            count = counts[cells, lo:hi].sum(axis=0).astype(np.float64)
+            total = sums[cells, lo:hi].sum(axis=0)
+            if window and window > 1:
+                count, total = _trailing_sum(count, window), _trailing_sum(total, window)
+                if measure == 'listings':
+                    count = count / np.minimum(np.arange(1, len(count) + 1), window)
+            if measure == 'listings':
+                columns[value] = count
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    columns[value] = np.where(count > 0, total / count, np.nan)
+        if by is None:
+            return pd.Series(columns[None], index=index, name=measure)
+        return pd.DataFrame(columns, index=index).sort_index(axis=1)
+
+
+# Sum over the trailing `window` entries (fewer at the start), from a running total
+def _trailing_sum(values, window):
+    running = np.concatenate([[0.0], np.cumsum(values)])
+    ends = np.arange(1, len(values) + 1)
+    return running[ends] - running[np.maximum(ends - window, 0)]
@@ -0,0 +1,60 @@
+import threading
+
+from data_loader import DATA_FILE, DELTA_DIR, SNAPSHOT_DIR, read_summary, write_summary
+from dataset import LiveDataset
+from queries import dashboard_kpis
+
+
+# Loads the LiveDataset (CSV or snapshot, cleaning, every index) in a background thread, so pages can
+# draw their layout straight away. Until it is ready, summary() serves the headline numbers persisted
+# by the last load; each newly loaded or refreshed version rewrites them.
+class Warmup:
+    def __init__(self, file_path=DATA_FILE, snapshot_dir=SNAPSHOT_DIR, delta_dir=DELTA_DIR):
+        self.file_path = file_path
+        self.snapshot_dir = snapshot_dir
+        self.delta_dir = delta_dir
+        self.live = None
+        self.error = None
+        self._summary = read_summary(snapshot_dir)
+        self._summary_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._load, name='dataset-warmup', daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        try:
+            self.live = LiveDataset(self.file_path, self.snapshot_dir, self.delta_dir)
+            self._update_summary(self.live.current)
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self._ready.set()
+
+    def _update_summary(self, dataset):
+        with self._summary_lock:
+            if self._summary is None or self._summary.get('version') != dataset.version:
+                self._summary = {'version': dataset.version, 'kpis': dashboard_kpis(dataset)}
+                write_summary(self._summary, self.snapshot_dir)
+
+    def ready(self):
+        return self._ready.is_set()
+
+    # Blocks until loading has finished (or failed); False if `timeout` seconds passed first
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    # Last persisted summary ({'version': ..., 'kpis': {...}}), possibly for an older version; None if
+    # no load has ever finished
+    def summary(self):
+        return self._summary
+
+    # The current Dataset with pending deltas folded in, or None while still loading. Re-raises a
+    # failed load.
+    def refresh(self):
+        if not self.ready():
+            return None
+        if self.error is not None:
+            raise self.error
+        dataset = self.live.refresh()
+        self._update_summary(dataset)
+        return dataset